@@ -0,0 +1,182 @@
+import heapq
+from typing import Dict, Iterable, List, Optional, Tuple
+
+METRICS = ("qte", "revenue")
+CLIENT_METRICS = ("ca_total", "commandes", "volume_ventes")
+
+
+class SpaceSaving:
+    # Heavy-hitter sketch (Metwally et al.): at most `capacity` counters whatever the
+    # number of distinct items; any item heavier than total/capacity is guaranteed kept.
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    def offer(self, item: str, weight: float = 1):
+        counts = self._counts
+        if item in counts:
+            counts[item] += weight
+            heapq.heappush(self._heap, (counts[item], item))
+        elif len(counts) < self.capacity:
+            counts[item] = weight
+            heapq.heappush(self._heap, (weight, item))
+        else:
+            # Evict the current minimum (skip stale heap entries) and inherit its count
+            while True:
+                count, victim = heapq.heappop(self._heap)
+                if counts.get(victim) == count:
+                    break
+            del counts[victim]
+            counts[item] = count + weight
+            heapq.heappush(self._heap, (counts[item], item))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, i) for i, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def top(self, k: int) -> List[Tuple[str, float]]:
+        return heapq.nlargest(k, self._counts.items(), key=lambda kv: kv[1])
+
+
+class SalesRollup:
+    # Per-day aggregates of the sales ledger, fed row by row in ledger order.
+    # Totals are accumulated in the same order as a full scan, so they match it exactly.
+
+    def __init__(self):
+        self.ca_total = 0.0
+        self.volume_total = 0
+        self.revenue_by_day: Dict[str, float] = {}
+        # Number of (date, nom) aggregates, used for memory accounting
+        self.entries = 0
+        # date -> nom -> [qte, revenue]
+        self._products_by_day: Dict[str, Dict[str, list]] = {}
+
+    def rebuild(self, rows: Iterable[Dict]):
+        self.__init__()
+        for row in rows:
+            self.add(row['date'], row['nom'], int(row['qte']), float(row['total']))
+
+    @classmethod
+    def from_aggregates(cls, ca_total: float, volume_total: int, revenue_by_day: Dict[str, float],
+                        products_by_day: Dict[str, Dict[str, list]]) -> "SalesRollup":
+        # Rollup of aggregates computed elsewhere (parallel_stats), taken over as is
+        rollup = cls()
+        rollup.ca_total, rollup.volume_total, rollup.revenue_by_day = ca_total, volume_total, revenue_by_day
+        rollup._products_by_day = products_by_day
+        rollup.entries = sum(len(products) for products in products_by_day.values())
+        return rollup
+
+    def add(self, date: str, nom: str, qte: int, total: float):
+        self.ca_total += total
+        self.volume_total += qte
+        self.revenue_by_day[date] = self.revenue_by_day.get(date, 0.0) + total
+        day = self._products_by_day.setdefault(date, {})
+        agg = day.get(nom)
+        if agg is None:
+            day[nom] = [qte, total]
+            self.entries += 1
+        else:
+            agg[0] += qte
+            agg[1] += total
+
+    def _window(self, start: Optional[str], end: Optional[str]):
+        # Dates are ISO strings: lexical order is chronological order
+        for date, products in self._products_by_day.items():
+            if (start is None or date >= start) and (end is None or date <= end):
+                yield products
+
+    def top_k(self, k: int, metric: str = "qte", start: Optional[str] = None, end: Optional[str] = None,
+              approx_capacity: Optional[int] = None) -> List[Tuple[str, float]]:
+        column = METRICS.index(metric)
+        if approx_capacity:
+            sketch = SpaceSaving(approx_capacity)
+            for products in self._window(start, end):
+                for nom, agg in products.items():
+                    sketch.offer(nom, agg[column])
+            return sketch.top(k)
+
+        merged: Dict[str, float] = {}
+        for products in self._window(start, end):
+            for nom, agg in products.items():
+                merged[nom] = merged.get(nom, 0) + agg[column]
+        return heapq.nlargest(k, merged.items(), key=lambda kv: kv[1])
+
+
+class ClientIndex:
+    # Per-client aggregates and order list, fed row by row in ledger order like
+    # SalesRollup, so client queries never scan the ledger.
+
+    def __init__(self):
+        # client -> {"commandes", "ca_total", "volume_ventes", "premiere_commande", "derniere_commande"}
+        self._clients: Dict[str, Dict] = {}
+        # (client, tid) -> {"tid", "date", "client", "total", "items"}, plus each client's tids in ledger order.
+        # Transaction ids are short random strings: two clients may share one, so the client is part of the key.
+        self._orders: Dict[Tuple[str, str], Dict] = {}
+        self._orders_by_client: Dict[str, List[str]] = {}
+        # Number of orders + clients, used for memory accounting
+        self.entries = 0
+
+    def rebuild(self, rows: Iterable[Dict]):
+        self.__init__()
+        for row in rows:
+            self.add(row['date'], row['tid'], row['client'], row['nom'], int(row['qte']), float(row['total']))
+
+    @classmethod
+    def from_aggregates(cls, clients: Dict[str, Dict], orders: Dict[Tuple[str, str], Dict]) -> "ClientIndex":
+        # Index of aggregates computed elsewhere (parallel_stats); `orders` in ledger order
+        index = cls()
+        index._clients, index._orders = clients, orders
+        for client, tid in orders:
+            index._orders_by_client.setdefault(client, []).append(tid)
+        index.entries = len(clients) + len(orders)
+        return index
+
+    def add(self, date: str, tid: str, client: str, nom: str, qte: int, total: float):
+        stats = self._clients.get(client)
+        if stats is None:
+            stats = self._clients[client] = {"commandes": 0, "ca_total": 0.0, "volume_ventes": 0,
+                                             "premiere_commande": date, "derniere_commande": date}
+            self.entries += 1
+        order = self._orders.get((client, tid))
+        if order is None:
+            order = self._orders[(client, tid)] = {"tid": tid, "date": date, "client": client, "total": 0.0, "items": []}
+            self._orders_by_client.setdefault(client, []).append(tid)
+            stats["commandes"] += 1
+            self.entries += 1
+        order["total"] += total
+        order["items"].append(f"{nom} (x{qte})")
+        stats["ca_total"] += total
+        stats["volume_ventes"] += qte
+        stats["derniere_commande"] = date
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def top(self, k: Optional[int] = None, metric: str = "ca_total") -> List[Dict]:
+        ranked = heapq.nlargest(k, self._clients.items(), key=lambda kv: kv[1][metric]) if k \
+            else sorted(self._clients.items(), key=lambda kv: kv[1][metric], reverse=True)
+        return [self._client_stats(client, stats) for client, stats in ranked]
+
+    def orders(self, client: str) -> Optional[List[Dict]]:
+        tids = self._orders_by_client.get(client)
+        if tids is None:
+            return None
+        orders = [self._orders[(client, tid)] for tid in tids]
+        return [{"tid": o["tid"], "date": o["date"], "client": o["client"], "total": round(o["total"], 2),
+                 "items": ", ".join(o["items"])} for o in sorted(orders, key=lambda o: o["date"], reverse=True)]
+
+    @staticmethod
+    def _client_stats(client: str, stats: Dict) -> Dict:
+        # The average basket is derived from the rounded revenue: a half-cent quotient then
+        # rounds the same way whatever float noise the unrounded sum carries
+        ca_total = round(stats["ca_total"], 2)
+        return {
+            "client": client,
+            "commandes": stats["commandes"],
+            "ca_total": ca_total,
+            "volume_ventes": stats["volume_ventes"],
+            "panier_moyen": round(ca_total / stats["commandes"], 2) if stats["commandes"] else 0.0,
+            "premiere_commande": stats["premiere_commande"],
+            "derniere_commande": stats["derniere_commande"],
+        }
@@ -1,15 +1,48 @@
-from fastapi import FastAPI, Depends, HTTPException, status, Body
+from fastapi import FastAPI, Depends, HTTPException, status, Body, Header, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
-from collections import Counter, defaultdict
-from datetime import datetime, timedelta
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional, Union
+from collections import defaultdict
+from concurrent.futures import TimeoutError as FutureTimeout
+import asyncio
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from contextlib import asynccontextmanager
 
 import database
 import auth
 import models
+import movements
+import provisioning
+import tenants
+from responses import FastJSONResponse, render_json
+from idempotency import IdempotencyConflict, IdempotencyStore
+from compression import CompressionMiddleware
+from scheduler import Scheduler
+from order_pipeline import OrderCommitQueue
+from events import EventHub
+from singleflight import SingleFlight
 
-app = FastAPI(title="SaaS Stock Manager API", version="1.0.0")
+# --- BACKGROUND MAINTENANCE ---
+
+scheduler = Scheduler()
+# Caches live in each worker's memory: every worker warms its own
+scheduler.add_job("warm-caches", 30, database.warm_caches, run_on_start=True, per_worker=True)
+# Shared files: one worker per tick
+scheduler.add_job("compact-journals", 600, database.compact_journals)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+    # Joins the committer thread: off the event loop
+    await asyncio.to_thread(order_queue.stop)
+
+app = FastAPI(title="SaaS Stock Manager API", version="1.0.0", lifespan=lifespan)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
 # CORS for frontend access
@@ -19,12 +52,113 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Catalog-Version", "X-Catalog-Epoch"],
 )
 
+# Negotiated gzip/brotli for the large list payloads
+app.add_middleware(CompressionMiddleware)
+
+@app.exception_handler(database.StorageError)
+async def storage_error(request: Request, exc: database.StorageError):
+    # Nothing was written (or the failure is logged for reconciliation): the client may retry
+    return JSONResponse(status_code=503, content={"detail": "Storage unavailable, please retry"})
+
+def _log_low_stock(product: dict, previous: int):
+    logging.warning(f"STOCK: Seuil bas franchi - produit #{product['id']} {product['nom']} ({previous} -> {product['quantite']})")
+
+database.add_low_stock_listener(_log_low_stock)
+
+# --- LIVE UPDATES (Server-Sent Events) ---
+# Each worker polls the shared data versions and the catalog change journal of the
+# tenants its subscribers follow, so they see writes made by any worker or the desktop app.
+
+EVENTS_POLL_INTERVAL = float(os.environ.get("EVENTS_POLL_INTERVAL", "0.5"))
+event_hub = EventHub()
+# tenant -> (catalog version, ledger version) already published
+_event_cursors = {}
+
+def publish_changes():
+    cursors = {}
+    for tenant_id in event_hub.tenants():
+        with tenants.use_tenant(tenant_id):
+            cursors[tenant_id] = _publish_tenant_changes(tenant_id, _event_cursors.get(tenant_id))
+    _event_cursors.clear()
+    _event_cursors.update(cursors)
+
+def _publish_tenant_changes(tenant_id: str, cursor: Optional[tuple]) -> tuple:
+    catalog_version = database.get_catalog_version()
+    ledger_version = database.get_data_version("ledger")
+    if cursor is None:
+        # New subscribers: they loaded the current data themselves
+        return catalog_version, ledger_version
+    published_catalog, published_ledger = cursor
+    if catalog_version != published_catalog:
+        delta = database.get_product_changes(*published_catalog)
+        if delta is None:
+            # Journal replaced: subscribers reload the catalog
+            event_hub.publish(tenant_id, "resync", "catalog", {})
+        else:
+            catalog_version = delta["version"], delta["epoch"]
+            for product in delta["products"]:
+                event_hub.publish(tenant_id, "product", product["id"], product)
+            for tombstone in delta["deleted"]:
+                event_hub.publish(tenant_id, "product", tombstone["id"], {"id": tombstone["id"], "deleted": True})
+    if ledger_version != published_ledger:
+        overview = database.get_sales_overview([])
+        event_hub.publish(tenant_id, "sales", "totals",
+                          {"ca_total": round(overview["ca_total"], 2), "volume_ventes": overview["volume_total"]})
+    return catalog_version, ledger_version
+
+scheduler.add_job("publish-events", EVENTS_POLL_INTERVAL, publish_changes, run_on_start=True, per_worker=True)
+
+# --- READ COALESCING ---
+# Identical concurrent requests for the same tenant and data version share one
+# computation; the result is kept READ_CACHE_TTL seconds more (0 disables that).
+
+READ_CACHE_TTL = float(os.environ.get("READ_CACHE_TTL", "2"))
+read_flights = SingleFlight(ttl=READ_CACHE_TTL)
+
+# --- CONDITIONAL GET (ETag) ---
+
+# Versions are shared by all workers and never repeat (see versions.py), so the same
+# data gets the same ETag whichever worker answers
+def make_etag(*parts) -> str:
+    return '"' + "-".join(map(str, parts)) + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison: ignore the W/ prefix
+    candidates = [tag.strip().removeprefix("W/") for tag in header.split(",")]
+    return etag in candidates
+
+def cache_headers(etag: str) -> dict:
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(etag))
+
 # --- AUTH ENDPOINTS ---
 
 @app.post("/api/auth/login", response_model=models.Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), x_tenant_id: Optional[str] = Header(None)):
+    # The shop is chosen at login (X-Tenant-ID header) and carried by the token afterwards
+    tenant_id = x_tenant_id or tenants.DEFAULT_TENANT
+    try:
+        tenants.set_current_tenant(tenant_id)
+        known_tenant = tenants.tenant_exists(tenant_id)
+    except ValueError:
+        known_tenant = False
+    if not known_tenant:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
     creds = database.get_user_credentials(form_data.username)
     if not creds:
         raise HTTPException(
@@ -42,15 +176,55 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = auth.create_access_token(
-        data={"sub": form_data.username}, expires_delta=access_token_expires
+        data={"sub": form_data.username, "tenant": tenant_id}, expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+# --- USERS ---
+
+MAX_BULK_USERS = 1000
+
+@app.post("/api/users/bulk", response_model=List[models.UserProvisionResult])
+def provision_users(payload: models.BulkUserCreate, current_user: str = Depends(auth.get_current_admin)):
+    # Onboarding, admins only (auth.ADMIN_USERS): creates accounts in the caller's tenant, one result per requested user
+    if len(payload.users) > MAX_BULK_USERS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_USERS} users per request")
+    return provisioning.provision_users([(u.username, u.password) for u in payload.users])
+
 # --- PRODUCTS ENDPOINTS ---
 
-@app.get("/api/products", response_model=List[models.Product])
-def get_products(current_user: str = Depends(auth.get_current_user)):
-    return database.get_all_products()
+@app.get("/api/products", response_model=Union[List[models.Product], models.ProductChanges])
+def get_products(request: Request, q: Optional[str] = None, limit: int = Query(50, ge=1, le=500),
+                 since: Optional[int] = Query(None, ge=0), epoch: Optional[str] = None,
+                 current_user: str = Depends(auth.get_current_user)):
+    if since is not None:
+        # Delta sync (models.ProductChanges): products changed since the client's catalog
+        # version, plus tombstones. The version only holds within the epoch it came with.
+        delta = database.get_product_changes(since, epoch) if epoch is not None else None
+        if delta is None:
+            raise HTTPException(status_code=410, detail="Unknown catalog version, reload the full catalog")
+        return FastJSONResponse(delta)
+    if q:
+        # Prefix and typo-tolerant name search, served from the in-memory index
+        return FastJSONResponse(database.search_products(q, limit))
+
+    # Versions are read before the data: a concurrent write can only make them older than the body, never newer.
+    # The catalog version and epoch are what to pass as ?since=&epoch= next time, also on a 304: a client
+    # told to reload after a journal replacement keeps its rows but must pick up the new epoch.
+    version, epoch = database.get_catalog_version()
+    catalog_headers = {"X-Catalog-Version": str(version), "X-Catalog-Epoch": epoch}
+    etag = make_etag("products", tenants.current_tenant(), database.get_data_version("inventory"))
+    if etag_matches(request, etag):
+        response = not_modified(etag)
+        response.headers.update(catalog_headers)
+        return response
+    # Rows come typed from database.py: skip per-row pydantic re-validation
+    return FastJSONResponse(database.get_all_products(), headers={**cache_headers(etag), **catalog_headers})
+
+@app.get("/api/products/low-stock", response_model=List[models.Product])
+def get_low_stock(threshold: int = Query(database.LOW_STOCK_THRESHOLD), limit: Optional[int] = Query(None, ge=1), current_user: str = Depends(auth.get_current_user)):
+    # Ascending quantity, served from the quantity-ordered index
+    return FastJSONResponse(database.get_low_stock_products(threshold, limit))
 
 @app.get("/api/products/{product_id}", response_model=models.Product)
 def get_product_detail(product_id: int, current_user: str= Depends(auth.get_current_user),dependencies=[oauth2_scheme]):
@@ -78,59 +252,161 @@ def delete_product(product_id: int, current_user: str= Depends(auth.get_current_
         raise HTTPException(status_code=404, detail="Product not found")
     return {"message": "Product deleted successfully"}
 
+# --- STOCK HISTORY ---
+# Replayed from the stock movement ledger, starting at the nearest checkpoint
+
+def _iso(value: Optional[str], end_of_day: bool = False) -> Optional[str]:
+    # A bare date covers the whole day
+    if value is None:
+        return None
+    try:
+        moment = movements.normalize(value)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid date: {value}")
+    if len(value) == 10 and end_of_day:
+        return f"{value}T23:59:59"
+    return moment
+
+@app.get("/api/products/{product_id}/movements")
+def get_product_movements(product_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                          limit: Optional[int] = Query(None, ge=1), current_user: str = Depends(auth.get_current_user)):
+    return FastJSONResponse(database.get_stock_movements(product_id, _iso(start), _iso(end, True), limit))
+
+@app.get("/api/stock/at")
+def get_stock_at(at: str, product_id: Optional[int] = None, current_user: str = Depends(auth.get_current_user)):
+    moment = _iso(at, True)
+    stock = database.get_stock_at(moment)
+    if stock is None:
+        raise HTTPException(status_code=404, detail="No stock history before this date")
+    if product_id is not None:
+        if product_id not in stock:
+            raise HTTPException(status_code=404, detail="Product not found at this date")
+        return {"at": moment, "id": product_id, "quantite": stock[product_id]}
+    return FastJSONResponse({"at": moment, "stock": [{"id": pid, "quantite": q} for pid, q in sorted(stock.items())]})
+
+# --- EVENTS ENDPOINT ---
+
+@app.get("/api/events")
+async def stream_events(current_user: str = Depends(auth.get_stream_user)):
+    # "product" (changed or deleted) and "sales" (new totals) events for the caller's shop.
+    # EventSource clients pass their token as ?access_token=
+    return StreamingResponse(
+        event_hub.stream(tenants.current_tenant()),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# --- ADMIN ENDPOINTS ---
+
+@app.get("/api/admin/jobs")
+def get_jobs(current_user: str = Depends(auth.get_current_admin)):
+    return scheduler.metrics()
+
+@app.post("/api/admin/stats/rebuild")
+def rebuild_stats(workers: Optional[int] = Query(None, ge=1, le=64), current_user: str = Depends(auth.get_current_admin)):
+    # Recompute sales aggregates from the raw ledger on several cores (e.g. after a restore)
+    start = time.perf_counter()
+    result = database.rebuild_sales_caches(workers)
+    result["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    logging.info(f"SYSTEM: Recalcul des statistiques en {result['duration_ms']} ms")
+    return result
+
 # --- ORDERS ENDPOINTS ---
 
-@app.post("/api/orders", response_model=models.OrderResponse)
-def create_order(order: models.OrderCreate, current_user: str= Depends(auth.get_current_user),dependencies=[oauth2_scheme]):
-    products = database.get_all_products()
-    products_map = {p['id']: p for p in products}
-    
-    # Validation step
-    final_items = []
-    
-    for item in order.items:
-        if item.id not in products_map:
-            raise HTTPException(status_code=400, detail=f"Product ID {item.id} not found")
-        
-        prod_in_stock = products_map[item.id]
-        if item.qte > prod_in_stock['quantite']:
-            raise HTTPException(status_code=400, detail=f"Insufficient stock for {prod_in_stock['nom']}")
-            
-        final_items.append({
-            "id": item.id,
-            "nom": prod_in_stock['nom'],
-            "prix": prod_in_stock['prix'],
-            "qte": item.qte
-        })
+IDEMPOTENCY_WAIT_SECONDS = 30
+ORDER_TIMEOUT_SECONDS = 30
+# Shared by all the workers of a tenant: a retry is recognised whichever worker it reaches
+IDEMPOTENCY_FILE = ".idempotency.log"
+idempotency_store = IdempotencyStore(lambda key: os.path.join(tenants.tenant_dir(key[0]), IDEMPOTENCY_FILE))
 
-    # Execution step (Stock deduction)
-    for item in final_items:
-        prod_in_stock = products_map[item['id']]
-        # Update stock in memory map
-        prod_in_stock['quantite'] -= item['qte']
-        # Update in DB
-        database.update_product_data(item['id'], prod_in_stock['nom'], prod_in_stock['prix'], prod_in_stock['quantite'])
-    
-    # Record transaction
-    tid = database.record_sale_transaction(final_items, order.client)
-    
+# Concurrent orders are validated in sequence and persisted together (group commit)
+order_queue = OrderCommitQueue(database.commit_orders)
+
+class OrderNotConfirmed(HTTPException):
+    # 504 while the batch is still committing: `future` gets the order's real outcome
+    def __init__(self, future):
+        super().__init__(status_code=504, detail="Order not confirmed in time, retry with the same Idempotency-Key "
+                                                 "or check the order history")
+        self.future = future
+
+def _order_outcome(tid: Optional[str], error: Optional[str]) -> dict:
+    if error:
+        raise HTTPException(status_code=400, detail=error)
     return {"success": True, "message": "Order processed successfully", "transaction_id": tid}
 
+def process_order(order: models.OrderCreate) -> dict:
+    future = order_queue.submit(tenants.current_tenant(), [(item.id, item.qte) for item in order.items], order.client)
+    try:
+        tid, error = future.result(timeout=ORDER_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        raise OrderNotConfirmed(future)
+    return _order_outcome(tid, error)
+
+def _complete_late_order(key: tuple, entry, future):
+    # Outcome of an order answered 504, stored for the retries of its Idempotency-Key
+    try:
+        result = _order_outcome(*future.result())
+    except HTTPException as e:
+        idempotency_store.complete(entry, e.status_code, {"detail": e.detail})
+    except Exception:
+        idempotency_store.abandon(key, entry)
+    else:
+        idempotency_store.complete(entry, 200, result)
+
+@app.post("/api/orders", response_model=models.OrderResponse)
+def create_order(order: models.OrderCreate, current_user: str= Depends(auth.get_current_user), idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),dependencies=[oauth2_scheme]):
+    if not idempotency_key:
+        return process_order(order)
+
+    # Keys are private to a tenant and a user; the body fingerprint catches key reuse
+    key = (tenants.current_tenant(), current_user, idempotency_key)
+    try:
+        entry, owner = idempotency_store.begin(key, IdempotencyStore.fingerprint(order.model_dump_json()))
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency-Key already used with a different request")
+
+    if not owner:
+        # Duplicate: wait for the original (possibly still in flight) and replay its response
+        if not entry.wait(IDEMPOTENCY_WAIT_SECONDS) or entry.status_code is None:
+            raise HTTPException(status_code=409, detail="Original request with this Idempotency-Key is still in progress or failed")
+        return JSONResponse(status_code=entry.status_code, content=entry.body, headers={"Idempotent-Replayed": "true"})
+
+    try:
+        result = process_order(order)
+    except OrderNotConfirmed as e:
+        # Not a final answer: the entry stays pending until the batch commits
+        e.future.add_done_callback(lambda future: _complete_late_order(key, entry, future))
+        raise
+    except HTTPException as e:
+        idempotency_store.complete(entry, e.status_code, {"detail": e.detail})
+        raise
+    except Exception:
+        idempotency_store.abandon(key, entry)
+        raise
+    idempotency_store.complete(entry, 200, result)
+    return result
+
 @app.get("/api/orders", response_model=List[dict])
 def get_orders(current_user: str = Depends(auth.get_current_user),dependencies=[oauth2_scheme]):
+    # Same list for every user of the tenant: rendered once per ledger version
+    key = ("orders", tenants.current_tenant(), database.get_data_version("ledger"))
+    return Response(content=read_flights.do(key, _render_orders), media_type="application/json")
+
+def _render_orders() -> bytes:
     # Simple aggregation for order history list
     raw_sales = database.get_raw_stats()
     grouped = defaultdict(lambda: {'total': 0, 'items': [], 'date': '', 'client': ''})
     
     for row in raw_sales:
-        tid = row['tid']
-        grouped[tid]['date'] = row['date']
-        grouped[tid]['client'] = row['client']
-        grouped[tid]['total'] += float(row['total'])
-        grouped[tid]['items'].append(f"{row['nom']} (x{row['qte']})")
+        # Short transaction ids can collide between clients
+        order = grouped[(row['client'], row['tid'])]
+        order['date'] = row['date']
+        order['client'] = row['client']
+        order['total'] += float(row['total'])
+        order['items'].append(f"{row['nom']} (x{row['qte']})")
     
     result = []
-    for tid, data in grouped.items():
+    for (_, tid), data in grouped.items():
         result.append({
             "tid": tid,
             "date": data['date'],
@@ -138,40 +414,56 @@ def get_orders(current_user: str = Depends(auth.get_current_user),dependencies=[
             "total": round(data['total'], 2),
             "items": ", ".join(data['items'])
         })
-    return sorted(result, key=lambda x: x['date'], reverse=True)
+    return render_json(sorted(result, key=lambda x: x['date'], reverse=True))
+
+
+# --- CLIENTS ---
+# Served from the per-client index kept in step with the ledger, never from a ledger scan
+
+@app.get("/api/clients/stats")
+def get_client_stats(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=10000),
+    sort: str = Query("ca_total", pattern="^(ca_total|commandes|volume_ventes)$"),
+    current_user: str = Depends(auth.get_current_user),
+):
+    etag = make_etag("clients", tenants.current_tenant(), database.get_data_version("ledger"), sort, limit)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    return FastJSONResponse(database.get_client_stats(limit, sort), headers=cache_headers(etag))
+
+@app.get("/api/clients/{client_name}/orders")
+def get_client_orders(client_name: str, current_user: str = Depends(auth.get_current_user)):
+    orders = database.get_client_orders(client_name)
+    if orders is None:
+        raise HTTPException(status_code=404, detail="Client not found")
+    return FastJSONResponse(orders)
 
 
 # --- STATS ENDPOINT ---
 
-@app.get("/api/stats")
-def get_stats(current_user: str = Depends(auth.get_current_user),dependencies=[oauth2_scheme]):
-    raw_sales = database.get_raw_stats()
-    
-    ca_total = 0.0
-    volume_total = 0
-    ventes_par_produit = Counter()
-    ventes_par_jour = defaultdict(float)
-    
-    for row in raw_sales:
-        qte = int(row['qte'])
-        total_ligne = float(row['total'])
-        date = row['date']
-        nom = row['nom']
-        
-        ca_total += total_ligne
-        volume_total += qte
-        ventes_par_produit[nom] += qte
-        ventes_par_jour[date] += total_ligne
+TOP_K_SKETCH_FACTOR = 20
 
+@app.get("/api/stats")
+def get_stats(request: Request, response: Response, current_user: str = Depends(auth.get_current_user),dependencies=[oauth2_scheme]):
+    # The 7-day window moves with the calendar, so today's date is part of the version
     today = datetime.now()
-    dates_labels = []
-    valeurs_data = []
-    for i in range(6, -1, -1):
-        d = (today - timedelta(days=i)).strftime("%Y-%m-%d")
-        dates_labels.append(d)
-        valeurs_data.append(ventes_par_jour.get(d, 0.0))
-        
-    top_5 = ventes_par_produit.most_common(5)
+    key = ("stats", tenants.current_tenant(), database.get_data_version("ledger"), today.strftime("%Y%m%d"))
+    etag = make_etag(*key)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    # Shared, so never mutated afterwards
+    return read_flights.do(key, lambda: _stats_payload(today))
+
+def _stats_payload(today: datetime) -> dict:
+    dates_labels = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(6, -1, -1)]
+    # Served from the incremental per-day rollup instead of a full ledger scan
+    overview = database.get_sales_overview(dates_labels)
+    ca_total = overview["ca_total"]
+    volume_total = overview["volume_total"]
+    valeurs_data = [overview["revenue_by_day"][d] for d in dates_labels]
+    top_5 = database.get_top_products(5, "qte")
     
     return {
         "ca_total": round(ca_total, 2),
@@ -183,3 +475,21 @@ def get_stats(current_user: str = Depends(auth.get_current_user),dependencies=[o
         },
         "top_products": [{"nom": x[0], "qte": x[1]} for x in top_5]
     }
+
+@app.get("/api/stats/top-products")
+def get_top_products(
+    k: int = Query(5, ge=1, le=1000),
+    metric: str = Query("qte", pattern="^(qte|revenue)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    approx: bool = False,
+    current_user: str = Depends(auth.get_current_user),
+):
+    # approx=true bounds memory with a Space-Saving sketch of TOP_K_SKETCH_FACTOR * k counters
+    top = database.get_top_products(
+        k, metric,
+        start.isoformat() if start else None,
+        end.isoformat() if end else None,
+        approx_capacity=k * TOP_K_SKETCH_FACTOR if approx else None,
+    )
+    return [{"nom": nom, metric: round(value, 2) if metric == "revenue" else value} for nom, value in top]
@@ -1,12 +1,13 @@
-import hashlib
 import os
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
 from database import get_user_credentials
+import passwords
+import tenants
 
 # CONFIGURATION
 
@@ -18,13 +19,15 @@ if not SECRET_KEY:
     raise ValueError("SECRET_KEY environment variable is not set")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Accounts allowed to manage users (comma-separated usernames, per tenant)
+ADMIN_USERS = {u.strip() for u in os.environ.get("ADMIN_USERS", "admin").split(",") if u.strip()}
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+oauth2_optional = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
 def verify_password(plain_password, salt, hashed_password):
-    # Réplication exacte de la méthode de hachage de l'app desktop
-    computed_hash = hashlib.sha256((salt + plain_password).encode('utf-8')).hexdigest()
-    return computed_hash == hashed_password
+    # Même hachage que l'app desktop (passwords.py)
+    return passwords.hash_password(plain_password, salt) == hashed_password
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -37,17 +40,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
+    return _user_from_token(token)
+
+async def get_current_admin(username: str = Depends(get_current_user)):
+    if username not in ADMIN_USERS:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin rights required")
+    return username
+
+async def get_stream_user(token: Optional[str] = Depends(oauth2_optional), access_token: Optional[str] = Query(None)):
+    # Browser EventSource cannot send headers: the token may also come as ?access_token=
+    return _user_from_token(token or access_token)
+
+def _user_from_token(token: Optional[str]) -> str:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    if not token:
+        raise credentials_exception
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
             raise credentials_exception
-    except JWTError:
+        # Every database call of this request is scoped to the token's tenant
+        tenants.set_current_tenant(payload.get("tenant", tenants.DEFAULT_TENANT))
+    except (JWTError, ValueError):
         raise credentials_exception
     
     user_creds = get_user_credentials(username)
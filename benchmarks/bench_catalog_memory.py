@@ -0,0 +1,44 @@
+"""Memory of the in-memory catalog: dict of product dicts vs CompactCatalog.
+
+Usage: python benchmarks/bench_catalog_memory.py [nb_produits]
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from catalog import CompactCatalog
+
+
+def make_products(n):
+    # Realistic catalog: names repeat across variants (sizes, colours, ...)
+    return [{"id": i, "nom": f"Produit {i % 5000}", "prix": round(9.99 + i % 300, 2), "quantite": i % 40}
+            for i in range(1, n + 1)]
+
+
+def measure(build):
+    tracemalloc.start()
+    obj = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+    # Each layout gets its own freshly parsed rows, as after a CSV load
+    as_dicts, dict_bytes = measure(lambda: {p["id"]: p for p in make_products(n)})
+    compact, compact_bytes = measure(lambda: CompactCatalog.from_products(make_products(n)))
+
+    ids = list(range(1, n + 1, max(n // 10_000, 1)))
+    t_dict = min(timeit.repeat(lambda: [as_dicts[i]["quantite"] for i in ids], number=1, repeat=5))
+    t_compact = min(timeit.repeat(lambda: [compact[i]["quantite"] for i in ids], number=1, repeat=5))
+
+    print(f"{n} produits")
+    print(f"  dict de dicts     : {dict_bytes / 2**20:8.1f} Mo ({dict_bytes / n:.0f} o/produit)")
+    print(f"  CompactCatalog    : {compact_bytes / 2**20:8.1f} Mo ({compact_bytes / n:.0f} o/produit)")
+    print(f"  gain              : x{dict_bytes / compact_bytes:.1f}")
+    print(f"  {len(ids)} lectures     : dict {t_dict * 1000:.1f} ms, compact {t_compact * 1000:.1f} ms")
@@ -0,0 +1,75 @@
+"""Sequential vs parallel recomputation of the sales aggregates on a synthetic ledger.
+
+Usage: python benchmarks/bench_parallel_stats.py [nb_lignes]
+"""
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import analytics
+import parallel_stats
+
+FIELDNAMES = ['date', 'tid', 'id_prod', 'nom', 'prix', 'qte', 'total', 'client']
+
+
+def make_ledger(path, n):
+    # Orders of 3 lines, all for the same client and date, like database.commit_orders writes them
+    rng = random.Random(0)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES, delimiter=";")
+        writer.writeheader()
+        for i in range(n):
+            if i % 3 == 0:
+                tid, client = f"{i // 3:08x}", f"Client {rng.randint(1, 5000)}"
+                date = f"2026-{1 + i * 12 // n:02d}-{1 + (i // 3) % 28:02d}"
+            pid = rng.randint(1, 2000)
+            prix = round(rng.uniform(1, 900), 2)
+            qte = rng.randint(1, 5)
+            writer.writerow({"date": date, "tid": tid, "id_prod": pid, "nom": f"Produit {pid}", "prix": prix,
+                             "qte": qte, "total": prix * qte, "client": client})
+
+
+def sequential(path):
+    # What _ensure_rollup does on a full rebuild
+    with open(path, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter=";"))
+    rollup, clients = analytics.SalesRollup(), analytics.ClientIndex()
+    rollup.rebuild(rows)
+    clients.rebuild(rows)
+    return rollup, clients
+
+
+def summary(rollup, clients):
+    # What the API serves, rounded to the cent; clients by name (near-equal totals may rank differently)
+    return (round(rollup.ca_total, 2), rollup.volume_total,
+            {d: round(v, 2) for d, v in rollup.revenue_by_day.items()},
+            rollup.top_k(50), [(nom, round(v, 2)) for nom, v in rollup.top_k(50, "revenue")],
+            sorted(clients.top(), key=lambda c: c["client"]))
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    cores = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "ventes.csv")
+        make_ledger(path, n)
+        print(f"{n} lignes ({os.path.getsize(path) / 2**20:.0f} Mo), {cores} coeur(s)")
+
+        t0 = time.perf_counter()
+        expected = sequential(path)
+        base = time.perf_counter() - t0
+        expected = summary(*expected)
+        print(f"  sequentiel        : {base * 1000:8.0f} ms")
+
+        for workers in sorted({1, 2, 4, 8, cores}):
+            t0 = time.perf_counter()
+            rollup, clients, _ = parallel_stats.rebuild(path, workers)
+            elapsed = time.perf_counter() - t0
+            identical = summary(rollup, clients) == expected
+            print(f"  {workers:2d} processus       : {elapsed * 1000:8.0f} ms  x{base / elapsed:.2f}"
+                  f"  {'identique' if identical else 'DIFFERENT'}")
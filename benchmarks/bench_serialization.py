@@ -0,0 +1,45 @@
+"""Compare the default response_model path with FastJSONResponse on a large catalog.
+
+Usage: python benchmarks/bench_serialization.py [nb_produits]
+"""
+import os
+import sys
+import timeit
+from typing import List
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import models
+from responses import FastJSONResponse, orjson
+
+
+def make_products(n):
+    return [{"id": i, "nom": f"Produit {i % 500}", "prix": round(9.99 + i % 300, 2), "quantite": i % 40} for i in range(1, n + 1)]
+
+
+def default_path(rows, adapter):
+    # What FastAPI does for response_model=List[Product]: validate, serialize, then encode
+    validated = adapter.validate_python(rows)
+    return JSONResponse(adapter.dump_python(validated, mode="json")).body
+
+
+def fast_path(rows):
+    return FastJSONResponse(rows).body
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    rows = make_products(n)
+    adapter = TypeAdapter(List[models.Product])
+    repeat = 5
+
+    t_default = min(timeit.repeat(lambda: default_path(rows, adapter), number=1, repeat=repeat))
+    t_fast = min(timeit.repeat(lambda: fast_path(rows), number=1, repeat=repeat))
+
+    print(f"{n} produits (encoder: {'orjson' if orjson else 'json'})")
+    print(f"  response_model    : {t_default * 1000:8.1f} ms")
+    print(f"  FastJSONResponse  : {t_fast * 1000:8.1f} ms")
+    print(f"  speedup           : x{t_default / t_fast:.1f}")
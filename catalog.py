@@ -0,0 +1,108 @@
+import sys
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping, MutableMapping
+from typing import Dict, Iterable, Iterator
+
+FIELDS = ("id", "nom", "prix", "quantite")
+_POSITIONS = {field: i for i, field in enumerate(FIELDS)}
+
+
+class ProductView(Mapping):
+    # Read-only {"id", "nom", "prix", "quantite"} row, built on access.
+    # Existing code reading p['nom'], dict(p) or csv.DictWriter(p) keeps working.
+    __slots__ = ("_values",)
+
+    def __init__(self, pid: int, nom: str, prix: float, quantite: int):
+        self._values = (pid, nom, prix, quantite)
+
+    def __getitem__(self, key):
+        try:
+            return self._values[_POSITIONS[key]]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return 4
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CompactCatalog(MutableMapping):
+    # Products as struct-of-arrays, sorted by id: typed columns for id, prix and
+    # quantite (8 bytes each per SKU) plus a list of interned names, instead of one
+    # dict + boxed int/float objects per product. Lookups are a bisect on the ids.
+
+    def __init__(self):
+        self._ids = array("q")
+        self._prix = array("d")
+        self._quantites = array("q")
+        self._noms = []
+
+    @classmethod
+    def from_products(cls, products: Iterable[Dict]) -> "CompactCatalog":
+        catalog = cls()
+        rows = sorted(products, key=lambda p: p["id"])
+        catalog._ids = array("q", (p["id"] for p in rows))
+        catalog._prix = array("d", (p["prix"] for p in rows))
+        catalog._quantites = array("q", (p["quantite"] for p in rows))
+        catalog._noms = [sys.intern(p["nom"]) for p in rows]
+        return catalog
+
+    def _row(self, pid: int) -> int:
+        i = bisect_left(self._ids, pid)
+        if i < len(self._ids) and self._ids[i] == pid:
+            return i
+        return -1
+
+    def __getitem__(self, pid: int) -> ProductView:
+        i = self._row(pid)
+        if i < 0:
+            raise KeyError(pid)
+        return ProductView(self._ids[i], self._noms[i], self._prix[i], self._quantites[i])
+
+    def __setitem__(self, pid: int, product: Mapping):
+        i = bisect_left(self._ids, pid)
+        if i < len(self._ids) and self._ids[i] == pid:
+            self._noms[i] = sys.intern(product["nom"])
+            self._prix[i] = product["prix"]
+            self._quantites[i] = product["quantite"]
+        else:
+            self._ids.insert(i, pid)
+            self._noms.insert(i, sys.intern(product["nom"]))
+            self._prix.insert(i, product["prix"])
+            self._quantites.insert(i, product["quantite"])
+
+    def __delitem__(self, pid: int):
+        i = self._row(pid)
+        if i < 0:
+            raise KeyError(pid)
+        del self._ids[i], self._noms[i], self._prix[i], self._quantites[i]
+
+    def __contains__(self, pid) -> bool:
+        return isinstance(pid, int) and self._row(pid) >= 0
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def update_product(self, pid: int, **fields):
+        i = self._row(pid)
+        if i < 0:
+            raise KeyError(pid)
+        if "nom" in fields:
+            self._noms[i] = sys.intern(fields["nom"])
+        if "prix" in fields:
+            self._prix[i] = fields["prix"]
+        if "quantite" in fields:
+            self._quantites[i] = fields["quantite"]
+
+    def to_dicts(self):
+        return [{"id": pid, "nom": nom, "prix": prix, "quantite": q}
+                for pid, nom, prix, q in zip(self._ids, self._noms, self._prix, self._quantites)]
@@ -0,0 +1,220 @@
+import os
+import tempfile
+from bisect import bisect_right
+from typing import Dict, Iterable, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends may race with a compaction
+    fcntl = None
+
+# Catalog change journal, next to the inventory CSV (inventaire.csv ->
+# inventaire_journal.log): one "<id>;<0|1 deleted>" line appended after every write
+# that changed or removed a product, by the API and by the desktop app.
+#
+# The version of a change is the byte offset just after its line. Offsets only grow
+# and appends are ordered, so "everything after version v" is simply the bytes after
+# v, whichever worker wrote them. A line is appended once the inventory file already
+# holds the change: a client that has read up to version v has seen the data of every
+# change <= v.
+#
+# Versions only mean something within one journal file. Its first line, "#<epoch>",
+# identifies it: a restored, replaced or recreated journal has another epoch, so a
+# client's (version, epoch) from the previous file is rejected instead of being read
+# as an offset of the new one. Journals written before epochs existed have LEGACY_EPOCH.
+#
+# The journal only grows, and every cached worker indexes all of it: once it mostly
+# holds superseded changes, compact() rewrites it with the latest change of each product
+# still present, under a new epoch (clients reload the catalog once). Appends and the
+# compaction hold an flock on the journal file, and appenders check that the file they
+# locked is still the journal, so no change is written to a replaced file.
+
+LEGACY_EPOCH = "0"
+# Compact once the journal has this many changes and at least COMPACT_RATIO per product
+COMPACT_MIN_CHANGES = int(os.environ.get("JOURNAL_COMPACT_MIN_CHANGES", "10000"))
+COMPACT_RATIO = float(os.environ.get("JOURNAL_COMPACT_RATIO", "2"))
+
+
+def journal_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + "_journal.log"
+
+def append(csv_path: str, changed: Iterable[int] = (), deleted: Iterable[int] = ()):
+    lines = [f"{pid};0\n" for pid in changed] + [f"{pid};1\n" for pid in deleted]
+    if lines:
+        with _open_locked(csv_path) as f:
+            f.seek(0, os.SEEK_END)
+            f.write("".join(lines).encode('utf-8'))
+
+def ensure(csv_path: str):
+    # Creates the journal if needed, so that even the first version handed out carries its epoch
+    path = journal_path(csv_path)
+    if not os.path.exists(path):
+        _create(path)
+
+def _open_locked(csv_path: str):
+    # The current journal, created if needed, opened for update and flocked. The lock is
+    # released when the file is closed.
+    path = journal_path(csv_path)
+    while True:
+        ensure(csv_path)
+        try:
+            f = open(path, 'r+b')
+        except FileNotFoundError:
+            continue
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(f.fileno()).st_ino:
+                return f
+        except FileNotFoundError:
+            pass
+        # Replaced (compacted) or removed while waiting for the lock
+        f.close()
+
+def _create(path: str):
+    # The header is written aside and linked into place: no writer can append before it
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(f"#{os.urandom(8).hex()}\n")
+        os.link(tmp, path)
+    except FileExistsError:
+        # Created meanwhile by another writer
+        pass
+    finally:
+        os.remove(tmp)
+
+def _epoch(f) -> str:
+    f.seek(0)
+    header = f.readline(64)
+    if header.startswith(b"#") and header.endswith(b"\n"):
+        return header[1:-1].decode('ascii')
+    return LEGACY_EPOCH
+
+
+class ChangeJournal:
+    # In-memory index of the journal, read incrementally: the latest version of each
+    # product and every change in version order, for since(v) queries proportional to
+    # the number of changes after v.
+
+    def __init__(self, start: int = 0, epoch: str = LEGACY_EPOCH, inode: Optional[int] = None):
+        self.version = start
+        self.epoch = epoch
+        # File the versions refer to
+        self.inode = inode
+        self._latest: Dict[int, Tuple[int, bool]] = {}
+        self._versions: List[int] = []
+        self._ids: List[int] = []
+
+    @property
+    def entries(self) -> int:
+        return len(self._versions)
+
+    def refresh(self, path: str) -> int:
+        try:
+            f = open(path, 'rb')
+        except OSError:
+            if self.inode is not None:
+                # Journal removed: start over
+                self.__init__()
+            return self.version
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_ino != self.inode or st.st_size < self.version:
+                # New, replaced or truncated journal: start over
+                self.__init__(inode=st.st_ino)
+            if st.st_size > self.version:
+                f.seek(self.version)
+                data = f.read(st.st_size - self.version)
+                position = self.version
+                for line in data.splitlines(keepends=True):
+                    if not line.endswith(b"\n"):
+                        break
+                    if line.startswith(b"#"):
+                        if position == 0:
+                            self.epoch = line[1:].rstrip(b"\r\n").decode('ascii')
+                        position += len(line)
+                        continue
+                    position += len(line)
+                    pid, _, deleted = line.rstrip(b"\r\n").partition(b";")
+                    pid = int(pid)
+                    self._latest[pid] = (position, deleted == b"1")
+                    self._versions.append(position)
+                    self._ids.append(pid)
+                self.version = position
+        return self.version
+
+    def since(self, version: int) -> List[Tuple[int, int, bool]]:
+        # (id, latest version, deleted) for every product changed after `version`
+        result = []
+        seen = set()
+        for i in range(bisect_right(self._versions, version), len(self._versions)):
+            pid = self._ids[i]
+            if pid not in seen:
+                seen.add(pid)
+                latest, deleted = self._latest[pid]
+                result.append((pid, latest, deleted))
+        return result
+
+
+def compact(csv_path: str) -> bool:
+    # Rewrites the journal with the latest change of each product still present, under a
+    # new epoch, when it mostly holds superseded changes. True when it was rewritten.
+    path = journal_path(csv_path)
+    try:
+        if os.path.getsize(path) < COMPACT_MIN_CHANGES * len("0;0\n"):
+            return False
+    except OSError:
+        return False
+    with _open_locked(csv_path) as f:
+        journal = ChangeJournal()
+        journal.refresh(path)
+        if journal.entries < max(COMPACT_MIN_CHANGES, COMPACT_RATIO * len(journal._latest)):
+            return False
+        live = sorted((version, pid) for pid, (version, deleted) in journal._latest.items() if not deleted)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as out:
+                out.write(f"#{os.urandom(8).hex()}\n")
+                out.write("".join(f"{pid};0\n" for _, pid in live))
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+    return True
+
+
+# --- UNCACHED READS ---
+# For tenants served without caches: only the bytes that matter are read.
+
+def current_version(path: str) -> Tuple[int, str]:
+    # (offset after the last complete line, epoch)
+    try:
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            epoch = _epoch(f)
+            f.seek(max(size - 4096, 0))
+            tail = f.read(size - f.tell())
+    except OSError:
+        return 0, LEGACY_EPOCH
+    return size - len(tail) + tail.rfind(b"\n") + 1, epoch
+
+def read_since(path: str, since: int, epoch: str) -> Optional[ChangeJournal]:
+    # Index of the changes after `since` only; None when `since` is not a version of this journal
+    try:
+        with open(path, 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            if _epoch(f) != epoch:
+                return None
+            if since > 0:
+                f.seek(since - 1)
+                if f.read(1) != b"\n":
+                    return None
+    except OSError:
+        return ChangeJournal() if since == 0 and epoch == LEGACY_EPOCH else None
+    journal = ChangeJournal(since, epoch, inode)
+    journal.refresh(path)
+    return journal
@@ -0,0 +1,155 @@
+import zlib
+from typing import Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Large, repetitive JSON payloads (catalog, order history, exports)
+COMPRESSIBLE_PATHS = ("/api/products", "/api/orders", "/api/clients", "/api/export")
+
+# Below one TCP segment (~1460 bytes of payload) compression saves no round trip,
+# it only costs CPU on both ends.
+MINIMUM_SIZE = 1400
+
+
+class _GzipEncoder:
+    name = "gzip"
+
+    def __init__(self, level: int):
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._z.flush()
+
+
+class _BrotliEncoder:
+    name = "br"
+
+    def __init__(self, quality: int):
+        self._c = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.flush()
+
+    def finish(self) -> bytes:
+        return self._c.finish()
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if token:
+            accepted[token.strip().lower()] = q
+
+    def q_of(name: str) -> float:
+        return accepted.get(name, accepted.get("*", 0.0))
+
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    best = max(candidates, key=q_of)
+    return best if q_of(best) > 0 else None
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, paths: Tuple[str, ...] = COMPRESSIBLE_PATHS, minimum_size: int = MINIMUM_SIZE,
+                 gzip_level: int = 6, brotli_quality: int = 4):
+        self.app = app
+        self.paths = paths
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        responder = _CompressionResponder(send, encoding, self)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, send: Send, encoding: Optional[str], config: CompressionMiddleware):
+        self._send = send
+        self._encoding = encoding
+        self._config = config
+        self._start: Optional[Message] = None
+        self._encoder = None
+        self._passthrough = False
+
+    def _new_encoder(self):
+        if self._encoding == "br":
+            return _BrotliEncoder(self._config.brotli_quality)
+        return _GzipEncoder(self._config.gzip_level)
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            # Held back until the first body chunk tells us whether to compress
+            self._start = message
+            MutableHeaders(scope=message).add_vary_header("Accept-Encoding")
+            return
+
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start is not None:
+            start, self._start = self._start, None
+            headers = MutableHeaders(scope=start)
+            small = not more_body and len(body) < self._config.minimum_size
+            if self._encoding is None or small or "content-encoding" in headers or start["status"] in (204, 304):
+                self._passthrough = True
+                await self._send(start)
+                await self._send(message)
+                return
+
+            self._encoder = self._new_encoder()
+            headers["Content-Encoding"] = self._encoder.name
+            # The encoded representation differs byte-wise: downgrade a strong ETag
+            etag = headers.get("etag")
+            if etag and not etag.startswith("W/"):
+                headers["ETag"] = "W/" + etag
+            if more_body:
+                del headers["Content-Length"]
+                chunk = self._encoder.compress(body) + self._encoder.flush()
+            else:
+                chunk = self._encoder.compress(body) + self._encoder.finish()
+                headers["Content-Length"] = str(len(chunk))
+            await self._send(start)
+            await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+            return
+
+        if self._passthrough:
+            await self._send(message)
+            return
+
+        if more_body:
+            chunk = self._encoder.compress(body) + self._encoder.flush()
+        else:
+            chunk = self._encoder.compress(body) + self._encoder.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -1,10 +1,28 @@
 import csv
+import heapq
+import io
 import os
+import threading
 import uuid
+from contextlib import contextmanager
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import Callable, List, Dict, Optional, Tuple
 import logging
 
+import analytics
+import catalog
+import changes
+import indexes
+import movements
+import parallel_stats
+import snapshot
+import tenants
+
+try:
+    import fcntl
+except ImportError:  # Windows: writers are only serialized per process
+    fcntl = None
+
 # Configuration
 FICHIER_CSV = 'inventaire.csv'
 FICHIER_USERS = 'utilisateurs.csv'
@@ -13,31 +31,369 @@ FICHIER_LOG = 'security.log'
 
 logging.basicConfig(filename=FICHIER_LOG, level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# --- TENANTS ---
+# Every function below works on the tenant of the current request (see tenants.py):
+# its files, its data versions and its in-memory caches.
+
+_registry = tenants.TenantRegistry({"inventory": FICHIER_CSV, "users": FICHIER_USERS, "ledger": FICHIER_VENTES})
+
+def _state() -> tenants.TenantState:
+    return _registry.get(tenants.current_tenant())
+
+@contextmanager
+def _tenant_caches():
+    state = _state()
+    try:
+        with state.lock:
+            yield state
+    finally:
+        _registry.enforce_budget(state)
+
+# --- DATA VERSIONS ---
+# Monotonic change counters, bumped after every write so callers (ETags, caches)
+# can tell whether a dataset changed without re-reading the files. They are shared
+# by all the workers of a tenant: a write in one worker invalidates the others' caches.
+
+def get_data_version(dataset: str) -> int:
+    return _state().versions[dataset]
+
+def _bump_version(dataset: str) -> int:
+    return _state().bump(dataset)
+
+# --- IN-MEMORY INDEXES ---
+# Rebuilt from the CSV when they lag behind the inventory version, otherwise kept
+# in sync incrementally by the write functions below.
+
+LOW_STOCK_THRESHOLD = 5
+
+_low_stock_listeners: List[Tuple[int, Callable[[Dict, int], None]]] = []
+
+def add_low_stock_listener(callback: Callable[[Dict, int], None], threshold: int = LOW_STOCK_THRESHOLD):
+    # callback(product, previous_quantite) runs when a product drops below threshold
+    _low_stock_listeners.append((threshold, callback))
+
+def _ensure_indexes(state: tenants.TenantState) -> int:
+    # -1 (nothing built, nothing to keep in sync) for a tenant served uncached
+    with state.lock:
+        if not state.cached:
+            return -1
+        version = state.versions["inventory"]
+        if state.indexes_version != version:
+            products = get_all_products()
+            state.catalog = catalog.CompactCatalog.from_products(products)
+            state.search_index.rebuild(products)
+            state.stock_index.rebuild(products)
+            state.indexes_version = version
+        return state.indexes_version
+
+def _sync_indexes(state: tenants.TenantState, previous_version: int, upserts: List[Dict] = (), removals: List[int] = ()):
+    # Apply a write to the indexes only if they reflected the state it was based on,
+    # and no other write (from any worker) happened in between
+    crossed = []
+    with state.lock:
+        if state.indexes_version != previous_version or state.versions["inventory"] != previous_version + 1:
+            return
+        for product_id in removals:
+            state.catalog.pop(product_id, None)
+            state.search_index.remove(product_id)
+            state.stock_index.remove(product_id)
+        for product in upserts:
+            old = state.catalog.get(product['id'])
+            if old is not None:
+                crossed.append((dict(product), old['quantite']))
+            state.catalog[product['id']] = product
+            state.search_index.upsert(product)
+            state.stock_index.upsert(product)
+        state.indexes_version = state.versions["inventory"]
+    _registry.enforce_budget(state)
+
+    for product, previous in crossed:
+        for threshold, callback in _low_stock_listeners:
+            if previous >= threshold > product['quantite']:
+                try:
+                    callback(product, previous)
+                except Exception as e:
+                    logging.error(f"SYSTEM: Error in low stock listener - {e}")
+
+def search_products(query: str, limit: int = 50) -> List[Dict]:
+    with _tenant_caches() as state:
+        if not state.cached:
+            products = get_all_products()
+            by_id = {p['id']: p for p in products}
+            return [by_id[pid] for pid in indexes.scan_search(products, query, limit)]
+        _ensure_indexes(state)
+        return [dict(state.catalog[pid]) for pid in state.search_index.search(query, limit)]
+
+# --- DELTA SYNC ---
+# Catalog changes are journaled (changes.py) so clients can fetch only what changed
+# since the catalog version they hold, deletions included.
+
+def _record_changes(state: tenants.TenantState, changed: List[int] = (), deleted: List[int] = ()):
+    try:
+        changes.append(state.inventory_file, changed, deleted)
+    except Exception as e:
+        logging.error(f"SYSTEM: Error writing change journal - {e}")
+
+def compact_journals():
+    # Shared maintenance: rewrite the journals that mostly hold superseded changes (see changes.compact)
+    for tenant_id in tenants.tenant_ids():
+        try:
+            if changes.compact(os.path.join(tenants.tenant_dir(tenant_id), FICHIER_CSV)):
+                logging.info(f"SYSTEM: Change journal compacted ({tenant_id})")
+        except Exception as e:
+            logging.error(f"SYSTEM: Error compacting change journal ({tenant_id}) - {e}")
+
+def get_catalog_version() -> Tuple[int, str]:
+    # (version, epoch) of the change journal, see changes.py
+    with _tenant_caches() as state:
+        changes.ensure(state.inventory_file)
+        path = changes.journal_path(state.inventory_file)
+        if not state.cached:
+            return changes.current_version(path)
+        return state.journal.refresh(path), state.journal.epoch
+
+def get_product_changes(since: int, epoch: str) -> Optional[Dict]:
+    # None when `since` is not a version of this journal (other epoch, or beyond its end):
+    # the client must reload the whole catalog
+    with _tenant_caches() as state:
+        # Journal first: every change it lists is already in the inventory read below
+        path = changes.journal_path(state.inventory_file)
+        journal = state.journal if state.cached else changes.read_since(path, since, epoch)
+        if journal is None:
+            return None
+        version = journal.refresh(path)
+        if journal.epoch != epoch or since > version:
+            return None
+        if state.cached:
+            _ensure_indexes(state)
+            lookup = state.catalog.get
+        else:
+            lookup = {p['id']: p for p in get_all_products()}.get
+        products, deleted = [], []
+        for pid, changed_at, is_deleted in journal.since(since):
+            product = None if is_deleted else lookup(pid)
+            if product is None:
+                deleted.append({"id": pid, "version": changed_at})
+            else:
+                products.append({**product, "version": changed_at})
+        return {"version": version, "epoch": journal.epoch, "products": products, "deleted": deleted}
+
+def get_low_stock_products(threshold: int, limit: Optional[int] = None) -> List[Dict]:
+    with _tenant_caches() as state:
+        if not state.cached:
+            low = (p for p in get_all_products() if p['quantite'] < threshold)
+            key = lambda p: (p['quantite'], p['id'])
+            return heapq.nsmallest(limit, low, key=key) if limit is not None else sorted(low, key=key)
+        _ensure_indexes(state)
+        return [dict(state.catalog[pid]) for pid in state.stock_index.below(threshold, limit)]
+
+# --- SALES ROLLUP ---
+# The ledger is append-only: on version mismatch the rollup and the per-client index
+# (clients, their totals and orders) only read the rows appended since the byte offset
+# they stopped at, whichever worker wrote them. A ledger that shrank is read again in full.
+
+def _ensure_rollup(state: tenants.TenantState) -> int:
+    with state.lock:
+        if not state.cached:
+            return -1
+        version = state.versions["ledger"]
+        if state.rollup_version != version:
+            start = state.ledger_offset if state.rollup_version != -1 else 0
+            rows, end = _read_ledger(state.ledger_file, start)
+            if end < start:
+                rows, end = _read_ledger(state.ledger_file)
+                start = 0
+            if start == 0:
+                state.rollup.rebuild(rows)
+                state.clients.rebuild(rows)
+            else:
+                for row in rows:
+                    qte, total = int(row['qte']), float(row['total'])
+                    state.rollup.add(row['date'], row['nom'], qte, total)
+                    state.clients.add(row['date'], row['tid'], row['client'], row['nom'], qte, total)
+            state.ledger_offset = end
+            state.rollup_version = version
+        return state.rollup_version
+
+def get_sales_overview(dates: List[str]) -> Dict:
+    with _tenant_caches() as state:
+        if not state.cached:
+            return _scan_sales_overview(state, dates)
+        _ensure_rollup(state)
+        return {
+            "ca_total": state.rollup.ca_total,
+            "volume_total": state.rollup.volume_total,
+            "revenue_by_day": {d: state.rollup.revenue_by_day.get(d, 0.0) for d in dates},
+        }
+
+def get_top_products(k: int = 5, metric: str = "qte", start: Optional[str] = None, end: Optional[str] = None,
+                     approx_capacity: Optional[int] = None) -> List[Tuple[str, float]]:
+    with _tenant_caches() as state:
+        if not state.cached:
+            return _scan_top_products(state, k, metric, start, end, approx_capacity)
+        _ensure_rollup(state)
+        return state.rollup.top_k(k, metric, start, end, approx_capacity)
+
+def get_client_stats(limit: Optional[int] = None, metric: str = "ca_total") -> List[Dict]:
+    with _tenant_caches() as state:
+        if not state.cached:
+            return _scan_clients(state).top(limit, metric)
+        _ensure_rollup(state)
+        return state.clients.top(limit, metric)
+
+def get_client_orders(client_name: str) -> Optional[List[Dict]]:
+    # None for a client with no order in the ledger
+    with _tenant_caches() as state:
+        if not state.cached:
+            return _scan_clients(state, client_name).orders(client_name)
+        _ensure_rollup(state)
+        return state.clients.orders(client_name)
+
+# --- UNCACHED READS ---
+# Tenants over their cache budget (tenants.TENANT_CACHE_ROWS) are served by plain scans
+# of their files for a while, instead of building caches dropped right after the request.
+
+def _scan_sales_overview(state: tenants.TenantState, dates: List[str]) -> Dict:
+    ca_total, volume_total = 0.0, 0
+    by_day = dict.fromkeys(dates, 0.0)
+    for row in _read_ledger(state.ledger_file)[0]:
+        total = float(row['total'])
+        ca_total += total
+        volume_total += int(row['qte'])
+        if row['date'] in by_day:
+            by_day[row['date']] += total
+    return {"ca_total": ca_total, "volume_total": volume_total, "revenue_by_day": by_day}
+
+def _scan_top_products(state: tenants.TenantState, k: int, metric: str, start: Optional[str], end: Optional[str],
+                       approx_capacity: Optional[int]) -> List[Tuple[str, float]]:
+    sketch = analytics.SpaceSaving(approx_capacity) if approx_capacity else None
+    merged: Dict[str, float] = {}
+    for row in _read_ledger(state.ledger_file)[0]:
+        if (start is not None and row['date'] < start) or (end is not None and row['date'] > end):
+            continue
+        value = int(row['qte']) if metric == "qte" else float(row['total'])
+        if sketch is not None:
+            sketch.offer(row['nom'], value)
+        else:
+            merged[row['nom']] = merged.get(row['nom'], 0) + value
+    return sketch.top(k) if sketch is not None else heapq.nlargest(k, merged.items(), key=lambda kv: kv[1])
+
+def _scan_clients(state: tenants.TenantState, client_name: Optional[str] = None) -> analytics.ClientIndex:
+    rows = _read_ledger(state.ledger_file)[0]
+    index = analytics.ClientIndex()
+    index.rebuild(rows if client_name is None else (row for row in rows if row['client'] == client_name))
+    return index
+
+def rebuild_sales_caches(workers: Optional[int] = None) -> Dict:
+    # Full multi-core recomputation of the rollup and the client index (parallel_stats.py),
+    # built aside then swapped in: readers keep the previous aggregates meanwhile
+    state = _state()
+    version = state.versions["ledger"]
+    rollup, clients, offset = parallel_stats.rebuild(state.ledger_file, workers)
+    with _tenant_caches():
+        state.rollup, state.clients = rollup, clients
+        state.ledger_offset = offset
+        state.rollup_version = version
+    return {"ca_total": round(rollup.ca_total, 2), "volume_ventes": rollup.volume_total, "clients": len(clients)}
+
+def warm_caches():
+    # Background maintenance: rebuild stale indexes/rollups off the request path,
+    # for every tenant that still has caches
+    for state in _registry.states():
+        if not state.cached or (state.indexes_version == -1 and state.rollup_version == -1):
+            continue
+        with tenants.use_tenant(state.tenant_id), _tenant_caches() as cached:
+            _ensure_indexes(cached)
+            _ensure_rollup(cached)
+
 # --- USERS ---
 
 def get_user_credentials(username: str) -> Optional[Dict[str, str]]:
-    if not os.path.exists(FICHIER_USERS):
-        return None
+    with _tenant_caches() as state:
+        if not state.cached:
+            return _find_user(state.users_file, username)
+        version = state.versions["users"]
+        if state.users_version != version:
+            state.users = _read_users(state.users_file)
+            state.users_version = version
+        creds = state.users.get(username)
+        return dict(creds) if creds else None
+
+def _read_users(users_file: str) -> Dict[str, Dict[str, str]]:
+    users = {}
+    if not os.path.exists(users_file):
+        return users
     
     try:
-        with open(FICHIER_USERS, "r", newline="", encoding='utf-8') as f:
+        with open(users_file, "r", newline="", encoding='utf-8') as f:
             reader = csv.DictReader(f, delimiter=";")
             for row in reader:
+                # First entry wins, as with the previous linear lookup
+                users.setdefault(row['username'], {'salt': row['salt'], 'hash': row['hash']})
+    except Exception as e:
+        print(f"Error reading users: {e}")
+    return users
+
+def _find_user(users_file: str, username: str) -> Optional[Dict[str, str]]:
+    # Uncached lookup: first matching row, like _read_users
+    if not os.path.exists(users_file):
+        return None
+    try:
+        with open(users_file, "r", newline="", encoding='utf-8') as f:
+            for row in csv.DictReader(f, delimiter=";"):
                 if row['username'] == username:
                     return {'salt': row['salt'], 'hash': row['hash']}
     except Exception as e:
         print(f"Error reading users: {e}")
     return None
 
+USERS_FIELDNAMES = ['username', 'salt', 'hash']
+
+def add_users(users: List[Dict[str, str]]) -> Optional[List[str]]:
+    # One append for the whole batch of {'username', 'salt', 'hash'} rows. Names are checked
+    # again under the users file lock, the desktop app's too: a name created meanwhile by
+    # another call is skipped. Returns the names created, None when the write failed.
+    users_file = _state().users_file
+    with _file_lock(users_file):
+        existing = _read_users(users_file)
+        rows = [u for u in users if u['username'] not in existing]
+        if not rows:
+            return []
+        is_empty = not os.path.exists(users_file) or os.stat(users_file).st_size == 0
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=USERS_FIELDNAMES, delimiter=";")
+        if is_empty: writer.writeheader()
+        writer.writerows(rows)
+        try:
+            with open(users_file, 'a', newline='', encoding='utf-8') as f:
+                f.write(buffer.getvalue())
+                f.flush()
+                os.fsync(f.fileno())
+        except Exception as e:
+            logging.error(f"SYSTEM: Error saving users - {e}")
+            return None
+        finally:
+            _bump_version("users")
+    return [u['username'] for u in rows]
+
 # --- INVENTORY ---
 
 def get_all_products() -> List[Dict]:
     products = []
-    if not os.path.exists(FICHIER_CSV):
+    inventory_file = _state().inventory_file
+    if not os.path.exists(inventory_file):
         return products
+
+    # Fast path: binary snapshot, valid only if it was built from this exact CSV
+    cached = snapshot.load_snapshot(inventory_file)
+    if cached is not None:
+        return cached
     
     try:
-        with open(FICHIER_CSV, "r", newline="", encoding='utf-8') as f:
+        # Writers replace the file atomically: the open file is one complete version
+        with open(inventory_file, "r", newline="", encoding='utf-8') as f:
+            st = os.fstat(f.fileno())
+            signature = (st.st_size, st.st_mtime_ns)
             reader = csv.DictReader(f, delimiter=";")
             for row in reader:
                 products.append({
@@ -48,7 +404,16 @@ def get_all_products() -> List[Dict]:
                 })
     except Exception as e:
         print(f"Error reading inventory: {e}")
-    return sorted(products, key=lambda x: x['id'])
+        return sorted(products, key=lambda x: x['id'])
+    products = sorted(products, key=lambda x: x['id'])
+    _write_snapshot(products, inventory_file, signature)
+    return products
+
+def _write_snapshot(products: List[Dict], inventory_file: str, signature: Optional[Tuple[int, int]] = None):
+    try:
+        snapshot.write_snapshot(products, inventory_file, signature)
+    except Exception as e:
+        logging.error(f"SYSTEM: Error writing inventory snapshot - {e}")
 
 def get_product(product_id: int) -> Optional[Dict]:
     products = get_all_products()
@@ -57,90 +422,278 @@ def get_product(product_id: int) -> Optional[Dict]:
             return p
     return None
 
-def save_all_products(products: List[Dict]):
+class StorageError(Exception):
+    # A write could not be persisted
+    pass
+
+# --- WRITE LOCKS ---
+# Read-modify-write cycles on a tenant file (inventory, users) run under an flock on a
+# sibling .lock file, shared by every worker and thread: the data file itself is
+# replaced on each write, so it cannot carry the lock.
+
+_file_locks: Dict[str, threading.Lock] = {}
+_file_locks_guard = threading.Lock()
+
+@contextmanager
+def _file_lock(path: str):
+    with _file_locks_guard:
+        local = _file_locks.setdefault(path, threading.Lock())
+    with local, open(path + ".lock", "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        # Released when the lock file is closed
+        yield
+
+def save_all_products(products: List[Dict], stock_movements: List[Optional[Dict]] = ()):
+    # Copy-on-write: the new version is written aside then swapped in with os.replace,
+    # so readers keep the complete file they opened and never see a truncated one.
+    # The quantity changes it carries (movements.movement rows) go to the movement ledger.
+    # Raises StorageError when nothing was saved: callers must not journal or announce the change.
+    # Callers hold _file_lock(inventory_file) from the read of `products` on.
     try:
-        with open(FICHIER_CSV, 'w', newline='', encoding='utf-8') as f:
+        _swap_inventory(_write_inventory_aside(products), products, stock_movements)
+    except StorageError as e:
+        logging.error(f"SYSTEM: Error saving inventory - {e}")
+        raise
+
+def _write_inventory_aside(products: List[Dict]) -> Tuple[str, os.stat_result]:
+    # New version fully written and synced next to the inventory, not yet visible
+    tmp_file = f"{_state().inventory_file}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_file, 'w', newline='', encoding='utf-8') as f:
             fieldnames = ['id', 'nom', 'prix', 'quantite']
             writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
             writer.writeheader()
             for p in products:
                 writer.writerow(p)
+            f.flush()
+            os.fsync(f.fileno())
+            st = os.fstat(f.fileno())
     except Exception as e:
-        logging.error(f"SYSTEM: Error saving inventory - {e}")
+        _discard(tmp_file)
+        raise StorageError(e) from e
+    return tmp_file, st
+
+def _swap_inventory(written: Tuple[str, os.stat_result], products: List[Dict], stock_movements: List[Optional[Dict]]):
+    tmp_file, st = written
+    inventory_file = _state().inventory_file
+    try:
+        os.replace(tmp_file, inventory_file)
+    except Exception as e:
+        _discard(tmp_file)
+        raise StorageError(e) from e
+    # Signature of the file we wrote, not of whatever is at the path by now
+    _write_snapshot(products, inventory_file, (st.st_size, st.st_mtime_ns))
+    _record_movements(inventory_file, products, stock_movements)
+    _bump_version("inventory")
+
+def _discard(tmp_file: str):
+    try:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+    except OSError as e:
+        logging.error(f"SYSTEM: Error removing {tmp_file} - {e}")
+
+def _record_movements(inventory_file: str, products: List[Dict], stock_movements: List[Optional[Dict]]):
+    try:
+        movements.record(inventory_file, list(stock_movements), lambda: {p['id']: p['quantite'] for p in products})
+    except Exception as e:
+        logging.error(f"SYSTEM: Error recording stock movements - {e}")
+
+def get_stock_at(at: str) -> Optional[Dict[int, int]]:
+    return movements.stock_at(_state().inventory_file, at)
+
+def get_stock_movements(product_id: int, start: Optional[str] = None, end: Optional[str] = None,
+                        limit: Optional[int] = None) -> List[Dict]:
+    return movements.history(_state().inventory_file, product_id, start, end, limit)
 
 def add_new_product(nom: str, prix: float, quantite: int):
-    products = get_all_products()
-    max_id = max([p['id'] for p in products]) if products else 0
-    new_id = max_id + 1
-    new_prod = {"id": new_id, "nom": nom, "prix": prix, "quantite": quantite}
-    products.append(new_prod)
-    save_all_products(products)
+    state = _state()
+    with _file_lock(state.inventory_file):
+        version = _ensure_indexes(state)
+        products = get_all_products()
+        max_id = max([p['id'] for p in products]) if products else 0
+        new_id = max_id + 1
+        new_prod = {"id": new_id, "nom": nom, "prix": prix, "quantite": quantite}
+        products.append(new_prod)
+        save_all_products(products, [movements.movement(new_id, 0, quantite, movements.CREATION)])
+    _sync_indexes(state, version, upserts=[new_prod])
+    _record_changes(state, changed=[new_id])
     logging.info(f"INVENTAIRE: Ajout produit #{new_id} {nom}")
     return new_prod
 
 def update_product_data(product_id: int, nom: str, prix: float, quantite: int):
-    products = get_all_products()
-    found = False
-    for p in products:
-        if p['id'] == product_id:
-            p['nom'] = nom
-            p['prix'] = prix
-            p['quantite'] = quantite
-            found = True
-            break
-    
+    state = _state()
+    with _file_lock(state.inventory_file):
+        version = _ensure_indexes(state)
+        products = get_all_products()
+        found = None
+        for p in products:
+            if p['id'] == product_id:
+                change = movements.movement(product_id, p['quantite'], quantite, movements.MODIFICATION)
+                p['nom'] = nom
+                p['prix'] = prix
+                p['quantite'] = quantite
+                found = p
+                break
+        if found:
+            save_all_products(products, [change])
+
     if found:
-        save_all_products(products)
+        _sync_indexes(state, version, upserts=[found])
+        _record_changes(state, changed=[product_id])
         logging.info(f"INVENTAIRE: Update produit #{product_id}")
         return True
     return False
 
 def delete_product_data(product_id: int):
-    products = get_all_products()
-    new_products = [p for p in products if p['id'] != product_id]
-    if len(new_products) < len(products):
-        save_all_products(new_products)
+    state = _state()
+    with _file_lock(state.inventory_file):
+        version = _ensure_indexes(state)
+        products = get_all_products()
+        new_products = [p for p in products if p['id'] != product_id]
+        removed = next((p for p in products if p['id'] == product_id), None)
+        if removed is not None:
+            save_all_products(new_products, [movements.movement(product_id, removed['quantite'], 0, movements.SUPPRESSION)])
+
+    if removed is not None:
+        _sync_indexes(state, version, removals=[product_id])
+        _record_changes(state, deleted=[product_id])
         logging.info(f"INVENTAIRE: Delete produit #{product_id}")
         return True
     return False
 
 # --- SALES ---
 
-def record_sale_transaction(items: List[Dict], client_name: str) -> str:
-    transaction_id = str(uuid.uuid4())[:8]
-    date_str = datetime.now().strftime("%Y-%m-%d")
-    
-    is_empty = not os.path.exists(FICHIER_VENTES) or os.stat(FICHIER_VENTES).st_size == 0
-    fieldnames = ['date', 'tid', 'id_prod', 'nom', 'prix', 'qte', 'total', 'client']
-    
+SALES_FIELDNAMES = ['date', 'tid', 'id_prod', 'nom', 'prix', 'qte', 'total', 'client']
+
+def _sale_rows(items: List[Dict], client_name: str, transaction_id: str, date_str: str) -> List[Dict]:
+    return [{
+        'date': date_str,
+        'tid': transaction_id,
+        'id_prod': item['id'],
+        'nom': item['nom'],
+        'prix': item['prix'],
+        'qte': item['qte'],
+        'total': item['prix'] * item['qte'],
+        'client': client_name
+    } for item in items]
+
+def _append_sales(state: tenants.TenantState, rows: List[Dict]) -> bool:
+    # One write() for any number of rows, then a rollup already built reads them back
+    # incrementally; one not built yet (cold tenant, dropped caches) is left to the next read
+    is_empty = not os.path.exists(state.ledger_file) or os.stat(state.ledger_file).st_size == 0
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=SALES_FIELDNAMES, delimiter=";")
+    if is_empty: writer.writeheader()
+    writer.writerows(rows)
     try:
-        with open(FICHIER_VENTES, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
-            if is_empty: writer.writeheader()
-            
-            for item in items:
-                total = item['prix'] * item['qte']
-                writer.writerow({
-                    'date': date_str,
-                    'tid': transaction_id,
-                    'id_prod': item['id'],
-                    'nom': item['nom'],
-                    'prix': item['prix'],
-                    'qte': item['qte'],
-                    'total': total,
-                    'client': client_name
-                })
+        with open(state.ledger_file, 'a', newline='', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
     except Exception as e:
         logging.error(f"SYSTEM: Error recording sale - {e}")
-        
+        _bump_version("ledger")
+        return False
+
+    _bump_version("ledger")
+    if state.rollup_version != -1:
+        with _tenant_caches():
+            _ensure_rollup(state)
+    return True
+
+def record_sale_transaction(items: List[Dict], client_name: str) -> str:
+    transaction_id = str(uuid.uuid4())[:8]
+    date_str = datetime.now().strftime("%Y-%m-%d")
+    _append_sales(_state(), _sale_rows(items, client_name, transaction_id, date_str))
     return transaction_id
 
+def commit_orders(orders: List[Tuple[List[Tuple[int, int]], str]]) -> List[Tuple[Optional[str], Optional[str]]]:
+    # Group commit: validate each order in turn against the stock left by the previous
+    # ones, then persist the whole batch with one inventory write and one ledger append.
+    # Returns one (transaction_id, None) or (None, error) per order; raises StorageError
+    # (no order of the batch went through) when the batch could not be persisted.
+    state = _state()
+    # Stock read to stock swapped under the inventory lock: concurrent batches (other workers,
+    # product edits) apply on top of each other instead of overwriting each other's deductions
+    with _file_lock(state.inventory_file):
+        version = _ensure_indexes(state)
+        products = get_all_products()
+        products_map = {p['id']: p for p in products}
+        date_str = datetime.now().strftime("%Y-%m-%d")
+
+        results = []
+        rows = []
+        stock_movements = []
+        touched = {}
+        moment = movements.now()
+        for items, client_name in orders:
+            remaining = {}
+            final_items = []
+            error = None
+            for product_id, qte in items:
+                if product_id not in products_map:
+                    error = f"Product ID {product_id} not found"
+                    break
+                prod_in_stock = products_map[product_id]
+                available = remaining.get(product_id, prod_in_stock['quantite'])
+                if qte > available:
+                    error = f"Insufficient stock for {prod_in_stock['nom']}"
+                    break
+                remaining[product_id] = available - qte
+                final_items.append({"id": product_id, "nom": prod_in_stock['nom'], "prix": prod_in_stock['prix'], "qte": qte})
+            if error:
+                results.append((None, error))
+                continue
+
+            transaction_id = str(uuid.uuid4())[:8]
+            for product_id, quantite in remaining.items():
+                stock_movements.append(movements.movement(product_id, products_map[product_id]['quantite'], quantite,
+                                                          movements.VENTE, transaction_id, moment))
+                products_map[product_id]['quantite'] = quantite
+                touched[product_id] = products_map[product_id]
+            rows.extend(_sale_rows(final_items, client_name, transaction_id, date_str))
+            results.append((transaction_id, None))
+
+        if touched:
+            # Inventory written aside, then the sales, then the inventory swapped in: a crash
+            # in between leaves sales recorded without their stock deduction, never the reverse
+            written = _write_inventory_aside(products)
+            if not _append_sales(state, rows):
+                _discard(written[0])
+                raise StorageError("sales ledger append failed")
+            try:
+                _swap_inventory(written, products, stock_movements)
+            except StorageError:
+                tids = sorted({row['tid'] for row in rows})
+                logging.error(f"COMMANDES: Ventes {tids} enregistrees sans deduction du stock")
+                raise
+    if touched:
+        _sync_indexes(state, version, upserts=list(touched.values()))
+        _record_changes(state, changed=list(touched))
+        logging.info(f"COMMANDES: Lot de {len(orders)} commande(s), {len(touched)} produit(s) mis a jour")
+    return results
+
 def get_raw_stats():
     # Helper to read raw sales data for stats endpoint
-    sales = []
-    if os.path.exists(FICHIER_VENTES):
-        with open(FICHIER_VENTES, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter=";")
-            for row in reader:
-                sales.append(row)
-    return sales
+    return _read_ledger(_state().ledger_file)[0]
+
+def _read_ledger(ledger_file: str, start: int = 0) -> Tuple[List[Dict], int]:
+    # Rows from byte `start` up to the ledger size when the read began, stopping at the
+    # last complete line: an append running meanwhile is neither seen nor half-seen.
+    # Returns the rows and the offset to resume from.
+    if not os.path.exists(ledger_file):
+        return [], 0
+    with open(ledger_file, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            return [], 0
+        if end < start:
+            return [], end
+        start = max(start, len(header))
+        f.seek(start)
+        chunk = f.read(end - start)
+    complete = chunk.rfind(b"\n") + 1
+    fieldnames = next(csv.reader([header.decode('utf-8').rstrip("\r\n")], delimiter=";"))
+    reader = csv.DictReader(io.StringIO(chunk[:complete].decode('utf-8'), newline=""), fieldnames=fieldnames, delimiter=";")
+    return list(reader), start + complete
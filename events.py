@@ -0,0 +1,98 @@
+import asyncio
+import json
+import threading
+from typing import Any, AsyncIterator, Dict, Hashable, List, Optional, Set
+
+# Burst coalescing: a subscriber receives at most one batch per interval, and only
+# the latest payload per key (e.g. per product) within that batch.
+COALESCE_INTERVAL = 0.25
+HEARTBEAT_INTERVAL = 15.0
+# Beyond this many distinct pending keys a slow subscriber is told to resync instead
+MAX_PENDING = 1000
+
+
+class Subscriber:
+    __slots__ = ("tenant_id", "pending", "overflow", "wake")
+
+    def __init__(self, tenant_id: str):
+        self.tenant_id = tenant_id
+        self.pending: Dict[Hashable, tuple] = {}
+        self.overflow = False
+        self.wake = asyncio.Event()
+
+
+class EventHub:
+    # Fan-out of change events to Server-Sent Events subscribers. An idle subscriber
+    # costs one Event and an empty dict; publishers (worker threads) only schedule a
+    # callback on the event loop.
+
+    def __init__(self, coalesce_interval: float = COALESCE_INTERVAL, heartbeat_interval: float = HEARTBEAT_INTERVAL):
+        self.coalesce_interval = coalesce_interval
+        self.heartbeat_interval = heartbeat_interval
+        self._subscribers: Dict[str, Set[Subscriber]] = {}
+        self._subscribers_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(subs) for subs in self._subscribers.values())
+
+    def tenants(self) -> List[str]:
+        # Tenants with at least one subscriber (thread-safe)
+        with self._subscribers_lock:
+            return list(self._subscribers)
+
+    def publish(self, tenant_id: str, kind: str, key: Hashable, payload: Any):
+        # Thread-safe; a no-op while nobody listens to this tenant
+        loop = self._loop
+        if loop is None or not self._subscribers.get(tenant_id):
+            return
+        loop.call_soon_threadsafe(self._dispatch, tenant_id, kind, key, payload)
+
+    def _dispatch(self, tenant_id: str, kind: str, key: Hashable, payload: Any):
+        for sub in self._subscribers.get(tenant_id, ()):
+            if sub.overflow:
+                continue
+            sub.pending[(kind, key)] = (kind, payload)
+            if len(sub.pending) > MAX_PENDING:
+                sub.pending.clear()
+                sub.overflow = True
+            sub.wake.set()
+
+    def subscribe(self, tenant_id: str) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        sub = Subscriber(tenant_id)
+        with self._subscribers_lock:
+            self._subscribers.setdefault(tenant_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        with self._subscribers_lock:
+            subs = self._subscribers.get(sub.tenant_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self._subscribers[sub.tenant_id]
+
+    async def stream(self, tenant_id: str) -> AsyncIterator[str]:
+        sub = self.subscribe(tenant_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    await asyncio.wait_for(sub.wake.wait(), self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                # Let the burst settle, then send what is left after coalescing
+                await asyncio.sleep(self.coalesce_interval)
+                sub.wake.clear()
+                pending, sub.pending = sub.pending, {}
+                if sub.overflow:
+                    sub.overflow = False
+                    yield "event: resync\ndata: {}\n\n"
+                    continue
+                for kind, payload in pending.values():
+                    yield f"event: {kind}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+        finally:
+            self.unsubscribe(sub)
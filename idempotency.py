@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: the store is still shared through the file, but only serialized per process
+    fcntl = None
+
+DEFAULT_TTL = 24 * 3600
+DEFAULT_MAX_ENTRIES = 10_000
+# A request still "pending" after this long belongs to a worker that died: its key can run again
+DEFAULT_PENDING_TIMEOUT = 300
+# The log is rewritten once it holds twice the lines it had after the last rewrite, and at least this many
+COMPACT_MIN_LINES = 1000
+POLL_INTERVAL = 0.05
+
+PENDING, DONE, ABANDONED = "pending", "done", "abandoned"
+
+
+class IdempotencyConflict(Exception):
+    # Same key reused with a different request body
+    pass
+
+
+class IdempotencyEntry:
+    def __init__(self, store: "IdempotencyStore", path: str, key_hash: str, fingerprint: str):
+        self._store = store
+        self._path = path
+        self.key_hash = key_hash
+        self.fingerprint = fingerprint
+        self.status_code: Optional[int] = None
+        self.body: Any = None
+
+    def wait(self, timeout: float) -> bool:
+        # True once the original request completed or was abandoned, in whichever worker it ran
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self._store._record(self._path, self.key_hash)
+            if record is None or record["s"] != PENDING:
+                if record is not None and record["s"] == DONE:
+                    self.status_code, self.body = record["c"], record["b"]
+                return True
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(POLL_INTERVAL)
+
+
+class _Log:
+    # In-process view of one log file, read incrementally: latest record per key
+    def __init__(self, inode: int = 0):
+        self.inode = inode
+        self.offset = 0
+        self.lines = 0
+        # Lines found by the first read of this file (the last compaction's output)
+        self.base_lines: Optional[int] = None
+        self.records: Dict[str, Dict] = {}
+
+
+class IdempotencyStore:
+    # Idempotency-Key -> stored response, shared by every worker of a tenant through an
+    # append-only JSON-lines log (path_for(key)), written under an flock on a sibling
+    # .lock file. Entries are created when the first request starts, so duplicates
+    # arriving while it is still running (in any worker) wait for its result instead of
+    # executing again. Expired entries and, beyond max_entries, the oldest completed ones
+    # are dropped when the log is compacted; pending entries never are.
+
+    def __init__(self, path_for: Callable[[Tuple], str], max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl: float = DEFAULT_TTL, pending_timeout: float = DEFAULT_PENDING_TIMEOUT):
+        self.path_for = path_for
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.pending_timeout = pending_timeout
+        self._logs: Dict[str, _Log] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(payload: str) -> str:
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _hash(key: Tuple) -> str:
+        return hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def begin(self, key: Tuple, fingerprint: str) -> Tuple[IdempotencyEntry, bool]:
+        # Returns (entry, True) when the caller owns the execution, (entry, False) for a duplicate
+        path, key_hash = self.path_for(key), self._hash(key)
+        with self._exclusive(path):
+            record = self._live(self._refresh(path), key_hash, time.time())
+            entry = IdempotencyEntry(self, path, key_hash, fingerprint)
+            if record is not None:
+                if record["f"] != fingerprint:
+                    raise IdempotencyConflict(key)
+                return entry, False
+            self._append(path, {"k": key_hash, "f": fingerprint, "s": PENDING, "t": time.time()})
+            self._maybe_compact(path)
+            return entry, True
+
+    def complete(self, entry: IdempotencyEntry, status_code: int, body: Any):
+        entry.status_code = status_code
+        entry.body = body
+        with self._exclusive(entry._path):
+            self._append(entry._path, {"k": entry.key_hash, "f": entry.fingerprint, "s": DONE, "t": time.time(),
+                                       "c": status_code, "b": body})
+
+    def abandon(self, key: Tuple, entry: IdempotencyEntry):
+        # Unexpected failure: forget the key so a retry runs again; waiters see no result
+        with self._exclusive(entry._path):
+            self._append(entry._path, {"k": entry.key_hash, "f": entry.fingerprint, "s": ABANDONED, "t": time.time()})
+
+    # --- LOG FILE ---
+
+    @contextmanager
+    def _exclusive(self, path: str):
+        # The lock file is never replaced, unlike the log (see _maybe_compact)
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _live(self, log: _Log, key_hash: str, now: float) -> Optional[Dict]:
+        record = log.records.get(key_hash)
+        if record is None or record["s"] == ABANDONED:
+            return None
+        if record["s"] == PENDING and now - record["t"] > self.pending_timeout:
+            return None
+        if record["s"] == DONE and now - record["t"] > self.ttl:
+            return None
+        return record
+
+    def _record(self, path: str, key_hash: str) -> Optional[Dict]:
+        with self._lock:
+            return self._live(self._refresh(path), key_hash, time.time())
+
+    def _refresh(self, path: str) -> _Log:
+        # Caller holds self._lock. Reads the lines appended since the last call, up to the
+        # last complete one; starts over when the log was replaced by a compaction.
+        try:
+            st = os.stat(path)
+        except OSError:
+            log = self._logs[path] = _Log()
+            return log
+        log = self._logs.get(path)
+        if log is None or log.inode != st.st_ino or st.st_size < log.offset:
+            log = self._logs[path] = _Log(st.st_ino)
+        if st.st_size > log.offset:
+            with open(path, "rb") as f:
+                f.seek(log.offset)
+                data = f.read(st.st_size - log.offset)
+            data = data[:data.rfind(b"\n") + 1]
+            for line in data.splitlines():
+                record = json.loads(line)
+                log.records[record["k"]] = record
+                log.lines += 1
+            log.offset += len(data)
+        if log.base_lines is None:
+            log.base_lines = log.lines
+        return log
+
+    def _append(self, path: str, record: Dict):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def _maybe_compact(self, path: str):
+        # Caller holds the exclusive lock: rewrite the log with the live entries only
+        log = self._refresh(path)
+        if log.lines < max(COMPACT_MIN_LINES, 2 * log.base_lines):
+            return
+        now = time.time()
+        live = [r for r in log.records.values() if self._live(log, r["k"], now) is not None]
+        pending = [r for r in live if r["s"] == PENDING]
+        done = sorted((r for r in live if r["s"] == DONE), key=lambda r: r["t"])[-self.max_entries:]
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for record in sorted(pending + done, key=lambda r: r["t"]):
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        os.replace(tmp, path)
+        self._refresh(path)
@@ -0,0 +1,209 @@
+import bisect
+import heapq
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+_WORD_RE = re.compile(r"[0-9a-z]+")
+
+# Safety bounds so a one-letter prefix or a very common trigram stays cheap
+MAX_PREFIX_EXPANSION = 200
+MAX_FUZZY_CANDIDATES = 50
+
+
+def normalize(text: str) -> str:
+    # "Écran Gaming" -> "ecran gaming"
+    return unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii").lower()
+
+def tokenize(text: str) -> List[str]:
+    return _WORD_RE.findall(normalize(text))
+
+def trigrams(token: str) -> Set[str]:
+    padded = f"^{token}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    # Optimal string alignment (Levenshtein + adjacent transpositions, the most common
+    # typo: "rzyen" -> "ryzen" is 1, not 2), with early exit once every cell of a row
+    # exceeds max_distance
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb and ca != cb:
+                cost = min(cost, before[j - 2] + 1)
+            current.append(cost)
+        if min(current) > max_distance:
+            return max_distance + 1
+        before, previous = previous, current
+    return previous[-1]
+
+
+class ProductSearchIndex:
+    # Inverted index over the words of `nom`:
+    #   token -> product ids, a sorted vocabulary for prefix ranges,
+    #   and trigram -> tokens to find typo candidates without scanning the vocabulary.
+
+    def __init__(self):
+        self._names: Dict[int, str] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._vocabulary: List[str] = []
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+
+    def rebuild(self, products: List[Dict]):
+        self.__init__()
+        for p in products:
+            self._names[p["id"]] = p["nom"]
+            for token in set(tokenize(p["nom"])):
+                self._postings.setdefault(token, set()).add(p["id"])
+        self._vocabulary = sorted(self._postings)
+        for token in self._vocabulary:
+            for gram in trigrams(token):
+                self._trigrams[gram].add(token)
+
+    def upsert(self, product: Dict):
+        self.remove(product["id"])
+        self._names[product["id"]] = product["nom"]
+        for token in set(tokenize(product["nom"])):
+            if token not in self._postings:
+                self._postings[token] = set()
+                bisect.insort(self._vocabulary, token)
+                for gram in trigrams(token):
+                    self._trigrams[gram].add(token)
+            self._postings[token].add(product["id"])
+
+    def remove(self, product_id: int):
+        old_name = self._names.pop(product_id, None)
+        if old_name is None:
+            return
+        for token in set(tokenize(old_name)):
+            ids = self._postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(product_id)
+            if not ids:
+                del self._postings[token]
+                i = bisect.bisect_left(self._vocabulary, token)
+                if i < len(self._vocabulary) and self._vocabulary[i] == token:
+                    del self._vocabulary[i]
+                for gram in trigrams(token):
+                    self._trigrams[gram].discard(token)
+
+    def _match_term(self, term: str, fuzzy: bool) -> Dict[str, float]:
+        # token -> weight: exact 1.0, prefix 0.8, typo 0.5
+        matches = {}
+        if term in self._postings:
+            matches[term] = 1.0
+        i = bisect.bisect_left(self._vocabulary, term)
+        end = min(i + MAX_PREFIX_EXPANSION, len(self._vocabulary))
+        while i < end and self._vocabulary[i].startswith(term):
+            matches.setdefault(self._vocabulary[i], 0.8)
+            i += 1
+        if matches or not fuzzy or len(term) < 3:
+            return matches
+
+        max_distance = 1 if len(term) < 8 else 2
+        shared = Counter()
+        for gram in trigrams(term):
+            shared.update(self._trigrams.get(gram, ()))
+        for token, _ in shared.most_common(MAX_FUZZY_CANDIDATES):
+            if edit_distance(term, token, max_distance) <= max_distance:
+                matches[token] = 0.5
+        return matches
+
+    def search(self, query: str, limit: int = 50, fuzzy: bool = True) -> List[int]:
+        # Every query word must match (AND); each word may hit several tokens (OR).
+        # Candidates are narrowed with set intersections before any per-id scoring.
+        candidates = None
+        per_term = []
+        for term in tokenize(query):
+            tiers = defaultdict(set)
+            for token, weight in self._match_term(term, fuzzy).items():
+                tiers[weight] |= self._postings[token]
+            matched = set().union(*tiers.values())
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+            per_term.append(sorted(tiers.items(), reverse=True))
+        if not candidates:
+            return []
+
+        if all(len(tiers) == 1 for tiers in per_term):
+            # Same score for every candidate: order by id only
+            ranked = heapq.nsmallest(limit, candidates)
+        else:
+            def score(pid):
+                return sum(next(w for w, ids in tiers if pid in ids) for tiers in per_term)
+            ranked = [pid for pid, _ in heapq.nlargest(limit, ((pid, score(pid)) for pid in candidates), key=lambda kv: (kv[1], -kv[0]))]
+        return ranked
+
+
+def scan_search(products: List[Dict], query: str, limit: int = 50, fuzzy: bool = True) -> List[int]:
+    # ProductSearchIndex.search semantics with a linear scan and no index: for a tenant
+    # too large to cache, one scan is cheaper than building the index for one query
+    terms = tokenize(query)
+    if not terms:
+        return []
+    names = [(p["id"], set(tokenize(p["nom"]))) for p in products]
+
+    def weight(term: str, tokens: Set[str], typos: bool) -> float:
+        if term in tokens:
+            return 1.0
+        if any(token.startswith(term) for token in tokens):
+            return 0.8
+        if typos:
+            max_distance = 1 if len(term) < 8 else 2
+            if any(edit_distance(term, token, max_distance) <= max_distance for token in tokens):
+                return 0.5
+        return 0.0
+
+    # As with the index, a word only falls back to typos when nothing matches it exactly or by prefix
+    typos = {term: fuzzy and len(term) >= 3 and not any(weight(term, tokens, False) for _, tokens in names)
+             for term in terms}
+    scored = []
+    for pid, tokens in names:
+        score = 0.0
+        for term in terms:
+            w = weight(term, tokens, typos[term])
+            if not w:
+                break
+            score += w
+        else:
+            scored.append((pid, score))
+    return [pid for pid, _ in heapq.nlargest(limit, scored, key=lambda kv: (kv[1], -kv[0]))]
+
+
+class StockLevelIndex:
+    # (quantite, id) pairs kept sorted: "everything below N" is one bisect plus a slice
+
+    def __init__(self):
+        self._levels: List[Tuple[int, int]] = []
+        self._quantities: Dict[int, int] = {}
+
+    def rebuild(self, products: List[Dict]):
+        self._quantities = {p["id"]: p["quantite"] for p in products}
+        self._levels = sorted((q, pid) for pid, q in self._quantities.items())
+
+    def upsert(self, product: Dict):
+        self.remove(product["id"])
+        self._quantities[product["id"]] = product["quantite"]
+        bisect.insort(self._levels, (product["quantite"], product["id"]))
+
+    def remove(self, product_id: int):
+        quantite = self._quantities.pop(product_id, None)
+        if quantite is None:
+            return
+        i = bisect.bisect_left(self._levels, (quantite, product_id))
+        if i < len(self._levels) and self._levels[i] == (quantite, product_id):
+            del self._levels[i]
+
+    def below(self, threshold: int, limit: Optional[int] = None) -> List[int]:
+        end = bisect.bisect_left(self._levels, (threshold, -math.inf))
+        if limit is not None:
+            end = min(end, limit)
+        return [pid for _, pid in self._levels[:end]]
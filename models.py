@@ -15,10 +15,32 @@ class Product(ProductBase):
     class Config:
         from_attributes = True
 
+class ProductVersion(Product):
+    version: int
+
+class ProductTombstone(BaseModel):
+    id: int
+    version: int
+
+class ProductChanges(BaseModel):
+    # Delta sync answer: GET /api/products?since=<version>&epoch=<epoch>
+    version: int
+    epoch: str
+    products: List[ProductVersion]
+    deleted: List[ProductTombstone]
+
 class UserLogin(BaseModel):
     username: str
     password: str
 
+class BulkUserCreate(BaseModel):
+    users: List[UserLogin]
+
+class UserProvisionResult(BaseModel):
+    username: str
+    created: bool
+    message: str
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -0,0 +1,249 @@
+import csv
+import io
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized per process
+    fcntl = None
+
+# Stock movement ledger, kept next to the inventory CSV (inventaire.csv ->
+# inventaire_mouvements.csv). Every quantity change is appended as one row with the
+# resulting quantity; the CSV itself only holds the current stock.
+#
+# Checkpoints (inventaire_mouvements.ckpt) store the whole stock at a byte offset of
+# the movement file, one line each: "<date>;<offset>;<json {id: quantite}>". A
+# point-in-time query starts from the last checkpoint before the requested date and
+# replays only the movements after it. A checkpoint is written once the movements
+# appended since the previous one exceed both CHECKPOINT_BYTES and the size of that
+# previous checkpoint: a checkpoint is a full stock copy (about 15 MB at a million
+# products), so checkpoint storage and the stock() rebuilds done under the lock stay
+# proportional to the movements. The first write records the opening stock, so
+# products created before the ledger existed are covered.
+#
+# Dates are local, naive and to the second (normalize), so they compare as strings.
+# Rows are appended under an flock and never dated before the last row of the file:
+# the file is in date order, and a checkpoint's date is the latest date before it.
+
+FIELDNAMES = ['date', 'id_prod', 'delta', 'quantite', 'motif', 'ref']
+CHECKPOINT_BYTES = int(os.environ.get("MOVEMENTS_CHECKPOINT_BYTES", str(256 * 1024)))
+
+# Reasons
+CREATION = "creation"
+MODIFICATION = "modification"
+VENTE = "vente"
+SUPPRESSION = "suppression"
+
+
+def movements_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + "_mouvements.csv"
+
+def checkpoints_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + "_mouvements.ckpt"
+
+def now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+def normalize(date: str) -> str:
+    # Ledger form of an ISO date; aware values are converted to local time (ValueError if invalid)
+    if len(date) == 19 and date[10] == 'T':
+        return date
+    parsed = datetime.fromisoformat(date)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat(timespec="seconds")
+
+def movement(product_id: int, before: int, after: int, reason: str, ref: str = "", date: Optional[str] = None) -> Optional[Dict]:
+    # None when the quantity did not change (price or name edits)
+    if before == after and reason not in (CREATION, SUPPRESSION):
+        return None
+    return {'date': date or now(), 'id_prod': product_id, 'delta': after - before, 'quantite': after,
+            'motif': reason, 'ref': ref}
+
+def _apply(stock: Dict[int, int], row: Dict):
+    if row['motif'] == SUPPRESSION:
+        stock.pop(int(row['id_prod']), None)
+    else:
+        stock[int(row['id_prod'])] = int(row['quantite'])
+
+def _undo(stock: Dict[int, int], rows: List[Dict]):
+    for row in reversed(rows):
+        if row['motif'] == CREATION:
+            stock.pop(int(row['id_prod']), None)
+        else:
+            stock[int(row['id_prod'])] = int(row['quantite']) - int(row['delta'])
+
+# --- WRITE ---
+
+def record(csv_path: str, rows: List[Dict], stock: Callable[[], Dict[int, int]]):
+    # `stock()` returns the stock *after* these rows; only called when a checkpoint is due
+    rows = [dict(r) for r in rows if r is not None]
+    if not rows:
+        return
+    path, ckpt_path = movements_path(csv_path), checkpoints_path(csv_path)
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            start = f.seek(0, os.SEEK_END)
+            last = _last_date(f, start)
+            for row in rows:
+                row['date'] = normalize(row['date'])
+                if last is not None and row['date'] < last:
+                    # Clock skew between writers, or a date taken before the lock
+                    row['date'] = last
+                last = row['date']
+            current = None
+
+            if not _checkpoint_index(ckpt_path):
+                # Opening balance (also rebuilt when the checkpoint file was lost): undo
+                # the rows already in the file and these ones on the current stock
+                existing = list(_read_from(path, 0)) if start else []
+                current = stock()
+                opening = dict(current)
+                _undo(opening, existing + rows)
+                first = min([normalize(r['date']) for r in existing] + [rows[0]['date']])
+                _append_checkpoint(ckpt_path, first, 0, opening)
+
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=FIELDNAMES, delimiter=";")
+            if start == 0: writer.writeheader()
+            writer.writerows(rows)
+            f.write(buffer.getvalue().encode('utf-8'))
+            f.flush()
+            end = f.tell()
+
+            index = _checkpoint_index(ckpt_path)
+            _, last_offset, _, last_size = index[-1] if index else (None, 0, 0, 0)
+            if end - last_offset >= max(CHECKPOINT_BYTES, last_size):
+                _append_checkpoint(ckpt_path, last, end, current if current is not None else stock())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def _last_date(f, size: int) -> Optional[str]:
+    # Date of the last complete row, None for an empty file or a header alone
+    f.seek(max(size - 4096, 0))
+    lines = f.read(size - f.tell()).split(b"\n")[:-1]
+    if not lines or lines[-1].startswith(b"date;"):
+        return None
+    return normalize(lines[-1].split(b";", 1)[0].decode('utf-8'))
+
+def _append_checkpoint(ckpt_path: str, date: str, offset: int, stock: Dict[int, int]):
+    line = f"{date};{offset};{json.dumps(stock, separators=(',', ':'))}\n"
+    with open(ckpt_path, 'a', encoding='utf-8') as f:
+        f.write(line)
+
+# --- CHECKPOINT INDEX ---
+# (date, offset, position and size of the line) for every checkpoint, read incrementally:
+# the stock part of a line is only decoded for the checkpoint actually used.
+
+_index_lock = threading.Lock()
+_indexes: Dict[str, Tuple[int, List[Tuple[str, int, int, int]]]] = {}
+
+def _checkpoint_index(ckpt_path: str) -> List[Tuple[str, int, int, int]]:
+    with _index_lock:
+        read, entries = _indexes.get(ckpt_path, (0, []))
+        try:
+            size = os.path.getsize(ckpt_path)
+        except OSError:
+            size = 0
+        if size < read:
+            read, entries = 0, []
+        if size > read:
+            entries = list(entries)
+            with open(ckpt_path, 'rb') as f:
+                f.seek(read)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    date, offset, _ = line.split(b";", 2)
+                    entries.append((normalize(date.decode('utf-8')), int(offset), read, len(line)))
+                    read += len(line)
+        _indexes[ckpt_path] = (read, entries)
+        return entries
+
+def _load_checkpoint(ckpt_path: str, position: int) -> Dict[int, int]:
+    with open(ckpt_path, 'rb') as f:
+        f.seek(position)
+        _, _, payload = f.readline().split(b";", 2)
+    return {int(k): v for k, v in json.loads(payload).items()}
+
+def _checkpoint_before(csv_path: str, at: Optional[str]) -> Optional[Tuple[str, int, int, int]]:
+    # Last checkpoint whose date is <= at (dates are ISO strings: lexical = chronological)
+    best = None
+    for entry in _checkpoint_index(checkpoints_path(csv_path)):
+        if at is not None and entry[0] > at:
+            break
+        best = entry
+    return best
+
+def _stop_offset(csv_path: str, offset: int, at: str) -> Optional[int]:
+    # First checkpoint after `offset` dated after `at`: every row past it is later than `at`.
+    # Rows before it may still be out of order (files written before dates were clamped).
+    for date, ckpt_offset, _, _ in _checkpoint_index(checkpoints_path(csv_path)):
+        if ckpt_offset > offset and date > at:
+            return ckpt_offset
+    return None
+
+# --- READ ---
+
+def _read_from(path: str, offset: int, stop: Optional[int] = None):
+    # Rows after `offset`, up to `stop` or the last complete line present when the read began
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb') as f:
+        end = os.fstat(f.fileno()).st_size
+        if stop is not None:
+            end = min(end, stop)
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            return
+        fieldnames = next(csv.reader([header.decode('utf-8').rstrip("\r\n")], delimiter=";"))
+        f.seek(max(offset, len(header)))
+        remaining = end - f.tell()
+        while remaining > 0:
+            line = f.readline(remaining)
+            remaining -= len(line)
+            if not line.endswith(b"\n"):
+                return
+            yield dict(zip(fieldnames, next(csv.reader([line.decode('utf-8').rstrip("\r\n")], delimiter=";"))))
+
+def stock_at(csv_path: str, at: str) -> Optional[Dict[int, int]]:
+    # Stock of every product at date `at`; None before the ledger started
+    at = normalize(at)
+    checkpoint = _checkpoint_before(csv_path, at)
+    if checkpoint is None:
+        return None
+    _, offset, position, _ = checkpoint
+    stock = _load_checkpoint(checkpoints_path(csv_path), position)
+    for row in _read_from(movements_path(csv_path), offset, _stop_offset(csv_path, offset, at)):
+        if normalize(row['date']) <= at:
+            _apply(stock, row)
+    return stock
+
+def history(csv_path: str, product_id: int, start: Optional[str] = None, end: Optional[str] = None,
+            limit: Optional[int] = None) -> List[Dict]:
+    # Movements of one product between start and end (inclusive), in ledger order
+    start = normalize(start) if start else None
+    end = normalize(end) if end else None
+    checkpoint = _checkpoint_before(csv_path, start) if start else None
+    offset = checkpoint[1] if checkpoint else 0
+    stop = _stop_offset(csv_path, offset, end) if end else None
+    wanted = str(product_id)
+    result = []
+    for row in _read_from(movements_path(csv_path), offset, stop):
+        if row['id_prod'] != wanted:
+            continue
+        date = normalize(row['date'])
+        if (start is not None and date < start) or (end is not None and date > end):
+            continue
+        result.append({'date': date, 'delta': int(row['delta']), 'quantite': int(row['quantite']),
+                       'motif': row['motif'], 'ref': row['ref']})
+        if limit and len(result) >= limit:
+            break
+    return result
@@ -0,0 +1,93 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+import tenants
+
+# How long the committer keeps collecting after the first order of a batch
+DEFAULT_WINDOW = 0.005
+DEFAULT_MAX_BATCH = 256
+
+OrderLines = List[Tuple[int, int]]
+
+
+class OrderCommitQueue:
+    # Concurrent checkouts are queued and committed by a single thread in batches:
+    # one inventory rewrite and one ledger append per batch (per tenant) instead of
+    # one per order. Each caller still gets its own result through a Future.
+
+    def __init__(self, commit: Callable[[List[Tuple[OrderLines, str]]], List[Tuple[Optional[str], Optional[str]]]],
+                 window: float = DEFAULT_WINDOW, max_batch: int = DEFAULT_MAX_BATCH):
+        self._commit = commit
+        self.window = window
+        self.max_batch = max_batch
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Metrics
+        self.batches = 0
+        self.orders = 0
+
+    def submit(self, tenant_id: str, items: OrderLines, client_name: str) -> Future:
+        self._ensure_started()
+        future = Future()
+        self._queue.put((tenant_id, items, client_name, future))
+        return future
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _ensure_started(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="order-commit", daemon=True)
+                self._thread.start()
+
+    def _collect(self, first) -> Tuple[list, bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is None:
+                break
+            batch, stopping = self._collect(first)
+
+            by_tenant = {}
+            for tenant_id, items, client_name, future in batch:
+                by_tenant.setdefault(tenant_id, []).append((items, client_name, future))
+
+            for tenant_id, requests in by_tenant.items():
+                try:
+                    with tenants.use_tenant(tenant_id):
+                        results = self._commit([(items, client_name) for items, client_name, _ in requests])
+                except Exception as e:
+                    logging.error(f"SYSTEM: Error committing order batch - {e}")
+                    for _, _, future in requests:
+                        future.set_exception(e)
+                    continue
+                for (_, _, future), result in zip(requests, results):
+                    future.set_result(result)
+
+            self.batches += 1
+            self.orders += len(batch)
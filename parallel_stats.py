@@ -0,0 +1,215 @@
+import argparse
+import csv
+import io
+import multiprocessing
+import operator
+import os
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from typing import Dict, List, Optional, Tuple
+
+import analytics
+
+# Full recomputation of the sales aggregates of a large ledger (after a restore, for
+# ad-hoc reports) on several cores. The ledger is cut into byte ranges aligned on line
+# boundaries; each worker process parses and aggregates its range, and the parent only
+# merges the per-range aggregates, in ledger order. A float sum depends on the order of
+# its terms, so workers return the amounts of each sum rather than partial sums, and the
+# parent adds them up in ledger order: the results are those of a sequential scan bit
+# for bit, sub-cent amounts and half-cent ties included. Parsing, the costly part, stays
+# parallel; the parent does one float addition per amount.
+
+# Unless told otherwise, below this size a single process is faster than starting workers
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+
+
+def chunk_ranges(path: str, chunks: int) -> Tuple[List[str], List[Tuple[int, int]]]:
+    # Header fieldnames and (start, end) byte ranges, each starting at a line start.
+    # The size is pinned when the call starts: rows appended later are not included.
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        header = f.readline()
+        if not header.endswith(b"\n"):
+            return [], []
+        fieldnames = next(csv.reader([header.decode('utf-8').rstrip("\r\n")], delimiter=";"))
+        start = len(header)
+        bounds = [start]
+        for i in range(1, chunks):
+            target = start + (size - start) * i // chunks
+            if target <= bounds[-1]:
+                continue
+            f.seek(target - 1)
+            f.readline()
+            if f.tell() >= size:
+                break
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+        bounds.append(size)
+    return fieldnames, [(a, b) for a, b in zip(bounds, bounds[1:]) if b > a]
+
+class _Terms:
+    # The amounts of many float sums, by key, in ledger order. Packed as one flat array
+    # per kind of sum, so shipping them back costs 8 bytes per amount, not one object per sum.
+
+    def __init__(self):
+        self.by_key: Dict = {}
+
+    def add(self, key, amount: float):
+        terms = self.by_key.get(key)
+        if terms is None:
+            self.by_key[key] = [amount]
+        else:
+            terms.append(amount)
+
+    def pack(self) -> Tuple[List, array, array]:
+        flat = array('d')
+        for terms in self.by_key.values():
+            flat.extend(terms)
+        return list(self.by_key), array('q', map(len, self.by_key.values())), flat
+
+def _fold(sums: Dict, packed: Tuple[List, array, array]):
+    # Continue each sum with the terms of the next range: the additions of a sequential
+    # scan, in its order (not sum(): it compensates rounding errors on recent Pythons)
+    keys, counts, flat = packed
+    view, pos = memoryview(flat), 0
+    for key, n in zip(keys, counts):
+        if n == 1:
+            # Most orders and (day, product) pairs: no slice to build
+            sums[key] = sums.get(key, 0.0) + flat[pos]
+        else:
+            sums[key] = reduce(operator.add, view[pos:pos + n], sums.get(key, 0.0))
+        pos += n
+
+def aggregate_chunk(path: str, start: int, end: int, fieldnames: List[str]) -> Tuple[Dict, Dict, Dict, Dict, int]:
+    # Aggregates of one byte range, amounts apart:
+    #   rollup:  {"volume", "products_by_day": {date: {nom: qte}}}
+    #   clients: {client: [volume, first date, last date]}
+    #   orders:  {(client, tid): [date, items]} in order of first appearance
+    #   amounts: {"ca", "day", "product", "client", "order"} -> packed terms of each sum
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    # Only the last range can end inside a line (an append in progress)
+    data = data[:data.rfind(b"\n") + 1]
+    column = {name: i for i, name in enumerate(fieldnames)}
+    i_date, i_tid, i_nom, i_qte, i_total, i_client = (column[c] for c in ('date', 'tid', 'nom', 'qte', 'total', 'client'))
+
+    volume = 0
+    products_by_day: Dict[str, Dict[str, int]] = {}
+    clients: Dict[str, list] = {}
+    orders: Dict[Tuple[str, str], list] = {}
+    ca, by_day, by_product, by_client, by_order = _Terms(), _Terms(), _Terms(), _Terms(), _Terms()
+    for rec in csv.reader(io.StringIO(data.decode('utf-8'), newline=""), delimiter=";"):
+        if not rec:
+            continue
+        date, nom, client, tid = rec[i_date], rec[i_nom], rec[i_client], rec[i_tid]
+        qte, total = int(rec[i_qte]), float(rec[i_total])
+        volume += qte
+        ca.add(None, total)
+        by_day.add(date, total)
+        by_product.add((date, nom), total)
+        by_client.add(client, total)
+        by_order.add((client, tid), total)
+        day = products_by_day.get(date)
+        if day is None:
+            day = products_by_day[date] = {}
+        day[nom] = day.get(nom, 0) + qte
+        stats = clients.get(client)
+        if stats is None:
+            clients[client] = [qte, date, date]
+        else:
+            stats[0] += qte
+            stats[2] = date
+        order = orders.get((client, tid))
+        if order is None:
+            orders[(client, tid)] = [date, [f"{nom} (x{qte})"]]
+        else:
+            order[1].append(f"{nom} (x{qte})")
+    rollup = {"volume": volume, "products_by_day": products_by_day}
+    amounts = {"ca": ca.pack(), "day": by_day.pack(), "product": by_product.pack(),
+               "client": by_client.pack(), "order": by_order.pack()}
+    return rollup, clients, orders, amounts, start + len(data)
+
+def _merge(partials) -> Tuple[analytics.SalesRollup, analytics.ClientIndex]:
+    # Per-range aggregates, in ledger order -> the aggregates of the whole ledger
+    volume = 0
+    products_by_day: Dict[str, Dict[str, list]] = {}
+    clients: Dict[str, Dict] = {}
+    orders: Dict[Tuple[str, str], Dict] = {}
+    sums: Dict[str, Dict] = {"ca": {}, "day": {}, "product": {}, "client": {}, "order": {}}
+    for rollup, chunk_clients, chunk_orders, amounts, _ in partials:
+        volume += rollup["volume"]
+        for date, products in rollup["products_by_day"].items():
+            day = products_by_day.setdefault(date, {})
+            for nom, qte in products.items():
+                agg = day.get(nom)
+                if agg is None:
+                    day[nom] = [qte, 0.0]
+                else:
+                    agg[0] += qte
+        for client, (qte, first, last) in chunk_clients.items():
+            stats = clients.get(client)
+            if stats is None:
+                clients[client] = {"commandes": 0, "ca_total": 0.0, "volume_ventes": qte,
+                                   "premiere_commande": first, "derniere_commande": last}
+            else:
+                stats["volume_ventes"] += qte
+                stats["derniere_commande"] = last
+        for (client, tid), (date, items) in chunk_orders.items():
+            order = orders.get((client, tid))
+            if order is None:
+                # An order split across two ranges is counted once
+                orders[(client, tid)] = {"tid": tid, "date": date, "client": client, "total": 0.0, "items": items}
+                clients[client]["commandes"] += 1
+            else:
+                order["items"].extend(items)
+        for kind, packed in amounts.items():
+            _fold(sums[kind], packed)
+
+    for (date, nom), total in sums["product"].items():
+        products_by_day[date][nom][1] = total
+    for client, total in sums["client"].items():
+        clients[client]["ca_total"] = total
+    for key, total in sums["order"].items():
+        orders[key]["total"] = total
+    rollup = analytics.SalesRollup.from_aggregates(sums["ca"].get(None, 0.0), volume, sums["day"], products_by_day)
+    return rollup, analytics.ClientIndex.from_aggregates(clients, orders)
+
+def rebuild(path: str, workers: Optional[int] = None) -> Tuple[analytics.SalesRollup, analytics.ClientIndex, int]:
+    # Returns the aggregates and the ledger offset they cover
+    if not os.path.exists(path):
+        return analytics.SalesRollup(), analytics.ClientIndex(), 0
+    if workers is None:
+        workers = 1 if os.path.getsize(path) < PARALLEL_MIN_BYTES else os.cpu_count() or 1
+    fieldnames, ranges = chunk_ranges(path, workers)
+    if not ranges:
+        return analytics.SalesRollup(), analytics.ClientIndex(), 0
+
+    if len(ranges) == 1:
+        partials = [aggregate_chunk(path, start, end, fieldnames) for start, end in ranges]
+    else:
+        # spawn: safe to call from a threaded server process
+        starts, ends = zip(*ranges)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            partials = list(pool.map(aggregate_chunk, [path] * len(ranges), starts, ends, [fieldnames] * len(ranges)))
+
+    rollup, clients = _merge(partials)
+    return rollup, clients, partials[-1][4]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recalcul parallele des statistiques de ventes")
+    parser.add_argument("ledger", nargs="?", default="ventes.csv")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    rollup, clients, _ = rebuild(args.ledger, args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"CA total      : {round(rollup.ca_total, 2)}")
+    print(f"Volume ventes : {rollup.volume_total}")
+    print(f"Top 5 (qte)   : {rollup.top_k(5)}")
+    print(f"Clients       : {len(clients)}")
+    print(f"Duree         : {elapsed * 1000:.0f} ms")
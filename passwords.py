@@ -0,0 +1,38 @@
+import hashlib
+import re
+from typing import Optional, Tuple
+
+# Password rules and hashing, shared by the desktop app, the API and bulk provisioning.
+# The rules are checked once; only their wording differs between the French desktop UI
+# and the English API.
+
+MIN_LENGTH = 8
+
+RULES = (
+    ("too_short", lambda password: len(password) >= MIN_LENGTH),
+    ("missing_digit", lambda password: re.search(r"\d", password) is not None),
+    ("missing_uppercase", lambda password: re.search(r"[A-Z]", password) is not None),
+)
+
+MESSAGES = {
+    "fr": {"too_short": f"Trop court (min {MIN_LENGTH} chars).", "missing_digit": "Manque un chiffre.",
+           "missing_uppercase": "Manque une majuscule.", None: "Valide"},
+    "en": {"too_short": f"Too short (min {MIN_LENGTH} chars)", "missing_digit": "Missing a digit",
+           "missing_uppercase": "Missing an uppercase letter", None: "Valid"},
+}
+
+
+def failed_rule(password: str) -> Optional[str]:
+    # First rule the password breaks, None when it is acceptable
+    for rule, check in RULES:
+        if not check(password):
+            return rule
+    return None
+
+def validate(password: str, lang: str = "fr") -> Tuple[bool, str]:
+    rule = failed_rule(password)
+    return rule is None, MESSAGES[lang][rule]
+
+def hash_password(password: str, salt: str) -> str:
+    # Salted sha256, the format stored in utilisateurs.csv
+    return hashlib.sha256((salt + password).encode('utf-8')).hexdigest()
@@ -1,15 +1,29 @@
 import webview
-import requests
 import csv
 import os
-import hashlib
 import secrets
 import hmac
 import logging
-import re
+import io
+import bisect
 import uuid  # NOUVEAU : Pour générer un ID unique par panier
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from collections import Counter, defaultdict
+from itertools import islice
+
+import catalog
+import changes
+import movements
+import passwords
+import pwned_store
+import snapshot
+import versions
+
+try:
+    import fcntl
+except ImportError:  # Windows : le verrou ne protège que ce processus
+    fcntl = None
 
 # --- CONFIGURATION & LOGS ---
 fichier_csv = 'inventaire.csv'
@@ -25,9 +39,15 @@ logging.basicConfig(
 )
 
 # Variables globales
-data = {}
+data = catalog.CompactCatalog()  # id -> produit (lecture seule, voir modifier_produit)
 max_id = 0
 users_db = {}
+# Compteurs partagés avec l'API (même dossier) : chaque écriture invalide ses caches
+versions_partagees = versions.SharedVersions(versions.VERSIONS_FILE)
+# Mouvements de stock en attente, écrits avec la prochaine sauvegarde de l'inventaire
+mouvements_en_attente = []
+# Produits modifiés / supprimés depuis la dernière sauvegarde, pour le journal de synchro
+modifies_en_attente, supprimes_en_attente = set(), set()
 
 # --- GESTION PERSISTANCE (CSV) ---
 
@@ -46,59 +66,147 @@ def charger_users():
     except Exception as e:
         logging.error(f"SYSTEM: Erreur chargement users - {e}")
 
+@contextmanager
+def verrou_fichier(chemin):
+    # Même verrou que l'API (database._file_lock) : un fichier .lock à côté des données
+    with open(chemin + ".lock", "a") as verrou:
+        if fcntl is not None:
+            fcntl.flock(verrou.fileno(), fcntl.LOCK_EX)
+        yield
+
 def sauver_user(username, salt, hashed_pw):
+    # None si le compte est créé, sinon le message d'erreur. Le nom est revérifié dans le
+    # fichier sous le verrou : l'API a pu créer le même compte depuis le chargement.
     try:
-        is_empty = not os.path.exists(fichier_users) or os.stat(fichier_users).st_size == 0
-        with open(fichier_users, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=['username', 'salt', 'hash'], delimiter=";")
-            if is_empty: writer.writeheader()
-            writer.writerow({'username': username, 'salt': salt, 'hash': hashed_pw})
+        with verrou_fichier(fichier_users):
+            is_empty = not os.path.exists(fichier_users) or os.stat(fichier_users).st_size == 0
+            if not is_empty:
+                with open(fichier_users, "r", newline="", encoding='utf-8') as f:
+                    if any(row['username'] == username for row in csv.DictReader(f, delimiter=";")):
+                        return "Existe déjà."
+            with open(fichier_users, 'a', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=['username', 'salt', 'hash'], delimiter=";")
+                if is_empty: writer.writeheader()
+                writer.writerow({'username': username, 'salt': salt, 'hash': hashed_pw})
+        versions_partagees.bump("users")
     except Exception as e:
         logging.error(f"SYSTEM: Erreur sauvegarde user - {e}")
+        return "Erreur d'enregistrement du compte."
+    return None
 
 def charger_inventaire():
     global data, max_id
-    data = {}
+    data = catalog.CompactCatalog()
     max_id = 0
     if not os.path.exists(fichier_csv):
         with open(fichier_csv, 'w', newline='', encoding='utf-8') as f:
             writer = csv.DictWriter(f, fieldnames=['id', 'nom', 'prix', 'quantite'], delimiter=";")
             writer.writeheader()
     try:
-        with open(fichier_csv, "r", newline="", encoding='utf-8') as f:
-            reader = csv.DictReader(f, delimiter=";")
-            for row in reader:
-                id_prod = int(row["id"])
-                data[id_prod] = {"id": id_prod, "nom": row["nom"], "prix": float(row["prix"]), "quantite": int(row["quantite"])}
-                if id_prod > max_id: max_id = id_prod
+        # Démarrage rapide : snapshot binaire s'il correspond exactement au CSV
+        produits = snapshot.load_snapshot(fichier_csv)
+        if produits is None:
+            signature = snapshot.csv_signature(fichier_csv)
+            produits = snapshot.read_csv(fichier_csv)
+            ecrire_snapshot(produits, signature)
+        data = catalog.CompactCatalog.from_products(produits)
+        if produits: max_id = max(p["id"] for p in produits)
     except Exception as e:
         logging.error(f"SYSTEM: Erreur chargement inventaire - {e}")
+    reconstruire_index_tri()
+
+def ecrire_snapshot(produits, signature=None):
+    # Le snapshot n'est qu'un cache : son échec ne doit bloquer ni le chargement ni la sauvegarde
+    try:
+        snapshot.write_snapshot(produits, fichier_csv, signature)
+    except Exception as e:
+        logging.error(f"SYSTEM: Erreur ecriture snapshot inventaire - {e}")
 
 def sauver_inventaire():
+    # Écrit à côté, synchronisé puis remplacé d'un coup (comme database.py) : l'API lit le
+    # même fichier et ne doit jamais en voir une version tronquée
+    fichier_tmp = f"{fichier_csv}.{uuid.uuid4().hex[:8]}.tmp"
     try:
-        with open(fichier_csv, 'w', newline='', encoding='utf-8') as csvfile:
+        with open(fichier_tmp, 'w', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['id', 'nom', 'prix', 'quantite']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=";")
             writer.writeheader()
             for item in data.values():
                 writer.writerow(item)
+            csvfile.flush()
+            os.fsync(csvfile.fileno())
+            st = os.fstat(csvfile.fileno())
+        os.replace(fichier_tmp, fichier_csv)
+    except Exception as e:
+        logging.error(f"SYSTEM: Erreur sauvegarde inventaire - {e}")
+        if os.path.exists(fichier_tmp):
+            os.remove(fichier_tmp)
+        return
+    # Signature du fichier écrit, pas de celui présent entre-temps
+    ecrire_snapshot(data.to_dicts(), (st.st_size, st.st_mtime_ns))
+    try:
+        versions_partagees.bump("inventory")
+        movements.record(fichier_csv, mouvements_en_attente, lambda: {pid: data[pid]['quantite'] for pid in data})
+        mouvements_en_attente.clear()
+        changes.append(fichier_csv, modifies_en_attente - supprimes_en_attente, supprimes_en_attente)
+        modifies_en_attente.clear()
+        supprimes_en_attente.clear()
     except Exception as e:
         logging.error(f"SYSTEM: Erreur sauvegarde inventaire - {e}")
 
+# --- INDEX DE TRI (grille de stock paginée) ---
+# Une liste triée de (clé, id) par colonne, maintenue à chaque modification :
+# une page de la grille se lit sans retrier tout l'inventaire.
+COLONNES_TRI = ('id', 'nom', 'prix', 'quantite')
+index_tri = {}
+
+def _cle_tri(colonne, produit):
+    valeur = produit[colonne]
+    if colonne == 'nom': valeur = valeur.lower()
+    return (valeur, produit['id'])
+
+def reconstruire_index_tri():
+    global index_tri
+    index_tri = {col: sorted(_cle_tri(col, p) for p in data.values()) for col in COLONNES_TRI}
+
+def indexer_produit(produit):
+    for col in COLONNES_TRI:
+        bisect.insort(index_tri[col], _cle_tri(col, produit))
+
+def desindexer_produit(produit):
+    for col in COLONNES_TRI:
+        liste = index_tri[col]
+        cle = _cle_tri(col, produit)
+        i = bisect.bisect_left(liste, cle)
+        if i < len(liste) and liste[i] == cle: del liste[i]
+
+def modifier_produit(pid, motif=movements.MODIFICATION, ref='', **champs):
+    if 'quantite' in champs:
+        mouvements_en_attente.append(movements.movement(pid, data[pid]['quantite'], champs['quantite'], motif, ref))
+    desindexer_produit(data[pid])
+    data.update_product(pid, **champs)
+    modifies_en_attente.add(pid)
+    indexer_produit(data[pid])
+
 # --- GESTION VENTES (MODIFIÉ POUR TID) ---
-def enregistrer_vente(id_prod, nom, prix_unitaire, qte, client_nom, tid):
+def enregistrer_ventes(lignes, client_nom, tid):
+    # Un panier entier = une seule ouverture, une seule écriture bufferisée, un seul fsync
     try:
         is_empty = not os.path.exists(fichier_ventes) or os.stat(fichier_ventes).st_size == 0
         # Ajout de 'tid' (Transaction ID)
         fieldnames = ['date', 'tid', 'id_prod', 'nom', 'prix', 'qte', 'total', 'client']
-        
-        with open(fichier_ventes, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=";")
-            if is_empty: writer.writeheader()
-            
+        date_str = datetime.now().strftime("%Y-%m-%d")
+
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fieldnames, delimiter=";")
+        if is_empty: writer.writeheader()
+
+        total_panier = 0.0
+        nb_articles = 0
+        for id_prod, nom, prix_unitaire, qte in lignes:
             total = float(prix_unitaire) * int(qte)
-            date_str = datetime.now().strftime("%Y-%m-%d")
-            
+            total_panier += total
+            nb_articles += int(qte)
             writer.writerow({
                 'date': date_str,
                 'tid': tid,
@@ -109,37 +217,32 @@ def enregistrer_vente(id_prod, nom, prix_unitaire, qte, client_nom, tid):
                 'total': total,
                 'client': client_nom
             })
-            logging.info(f"VENTE: {qte}x {nom} ({total}€) - Client: {client_nom} [ID: {tid}]")
-            
+
+        with open(fichier_ventes, 'a', newline='', encoding='utf-8') as f:
+            f.write(buffer.getvalue())
+            f.flush()
+            os.fsync(f.fileno())
+        versions_partagees.bump("ledger")
+
+        logging.info(f"VENTE: {len(lignes)} ligne(s), {nb_articles} article(s) ({total_panier}€) - Client: {client_nom} [ID: {tid}]")
+        return True
+
     except Exception as e:
         logging.error(f"SYSTEM: Erreur enregistrement vente - {e}")
+        return False
 
 # --- SECURITY UTILS ---
+# Mêmes règles et même hachage que l'API (passwords.py)
 def hacher_mdp(password, salt):
-    return hashlib.sha256((salt + password).encode('utf-8')).hexdigest()
+    return passwords.hash_password(password, salt)
 
 def valider_complexite_mdp(password):
-    if len(password) < 8: return False, "Trop court (min 8 chars)."
-    if not re.search(r"\d", password): return False, "Manque un chiffre."
-    if not re.search(r"[A-Z]", password): return False, "Manque une majuscule."
-    return True, "Valide"
+    return passwords.validate(password, "fr")
 
 def verifier_leak_pwned(password):
-    sha1_password = hashlib.sha1(password.encode('utf-8')).hexdigest().upper()
-    prefix, suffix = sha1_password[:5], sha1_password[5:]
-    url = f"https://api.pwnedpasswords.com/range/{prefix}"
-    headers = {
-        'User-Agent': 'SaaS-Stock-Manager-Pro/1.0'
-    }
-    try:
-        response = requests.get(url, headers=headers, timeout=3)
-        if response.status_code != 200: return False, 0
-        hashes = (line.split(':') for line in response.text.splitlines())
-        for h, count in hashes:
-            if h == suffix: return True, int(count)
-        return False, 0
-    except:
-        return False, 0
+    # Base locale (pwned.bin), sinon API k-anonymity avec cache LRU.
+    # Lève pwned_store.LeakCheckUnavailable si aucune des deux ne répond.
+    return pwned_store.check_password(password)
 
 # --- FRONTEND ---
 html_content = """
@@ -242,6 +345,7 @@ html_content = """
                         <div class="card" style="border: 1px solid var(--warning);">
                             <h3 style="color:var(--warning)">🛒 Panier / Caisse</h3>
                             <input id="sim-client" type="text" placeholder="Nom du client (pour toute la commande)" style="margin-bottom: 10px;">
+                            <input id="sim-recherche" type="text" placeholder="Rechercher un produit (nom ou #id)..." oninput="rechercherCaisse()">
                             
                             <div class="flex-row" style="margin-bottom: 5px;">
                                 <select id="sim-select" style="flex:2"><option>Chargement...</option></select>
@@ -267,10 +371,22 @@ html_content = """
                             <h3>Inventaire Temps Réel</h3>
                             <button class="btn-primary" style="padding:5px 10px;" onclick="chargerInventaireJS()">Rafraîchir</button>
                         </div>
+                        <input id="stock-search" type="text" placeholder="Rechercher un produit..." oninput="rechercherStock()">
                         <table>
-                            <thead><tr><th>ID</th><th>Produit</th><th>Prix</th><th>Stock</th><th>Action</th></tr></thead>
+                            <thead><tr>
+                                <th style="cursor:pointer" onclick="trierStock('id')">ID</th>
+                                <th style="cursor:pointer" onclick="trierStock('nom')">Produit</th>
+                                <th style="cursor:pointer" onclick="trierStock('prix')">Prix</th>
+                                <th style="cursor:pointer" onclick="trierStock('quantite')">Stock</th>
+                                <th>Action</th>
+                            </tr></thead>
                             <tbody id="inventory-body"></tbody>
                         </table>
+                        <div class="flex-row" style="justify-content:flex-end; align-items:center; margin-top:10px;">
+                            <span id="stock-page-info" style="color:var(--text-muted); font-size:0.9em;"></span>
+                            <button class="btn-primary" style="padding:5px 10px;" onclick="changerPageStock(-1)">◀</button>
+                            <button class="btn-primary" style="padding:5px 10px;" onclick="changerPageStock(1)">▶</button>
+                        </div>
                     </div>
                 </div>
 
@@ -370,6 +486,7 @@ html_content = """
                 document.getElementById('app-view').classList.remove('hidden');
                 document.getElementById('display-user').innerText = u;
                 chargerInventaireJS();
+                chargerSelecteurCaisse();
                 chargerStatsJS(); 
             } else {
                 document.getElementById('auth-feedback').innerText = res.message;
@@ -396,13 +513,47 @@ html_content = """
             if(tabId === 'tab-stats') chargerStatsJS();
         }
 
+        // Grille paginée : seule la page visible est demandée au backend
+        const stockGrid = { offset: 0, limit: 50, tri: 'id', descendant: false, recherche: '', total: 0 };
+        let rechercheTimer = null;
+
+        function trierStock(colonne) {
+            stockGrid.descendant = (stockGrid.tri === colonne) ? !stockGrid.descendant : false;
+            stockGrid.tri = colonne;
+            stockGrid.offset = 0;
+            chargerInventaireJS();
+        }
+
+        function rechercherStock() {
+            clearTimeout(rechercheTimer);
+            rechercheTimer = setTimeout(() => {
+                stockGrid.recherche = document.getElementById('stock-search').value;
+                stockGrid.offset = 0;
+                chargerInventaireJS();
+            }, 250);
+        }
+
+        function changerPageStock(sens) {
+            const offset = stockGrid.offset + sens * stockGrid.limit;
+            if(offset < 0 || offset >= stockGrid.total) return;
+            stockGrid.offset = offset;
+            chargerInventaireJS();
+        }
+
         async function chargerInventaireJS() {
-            currentStock = await pywebview.api.get_stock();
+            const page = await pywebview.api.get_stock_page(stockGrid.offset, stockGrid.limit, stockGrid.tri, stockGrid.descendant, stockGrid.recherche);
+            stockGrid.total = page.total;
+            if(stockGrid.offset >= page.total && page.total > 0) {
+                stockGrid.offset = Math.floor((page.total - 1) / stockGrid.limit) * stockGrid.limit;
+                return chargerInventaireJS();
+            }
+            currentStock = page.items;
             const tbody = document.getElementById('inventory-body');
-            const select = document.getElementById('sim-select');
             
             tbody.innerHTML = "";
-            select.innerHTML = "<option value=''>-- Sélectionner Produit --</option>";
+
+            const fin = Math.min(stockGrid.offset + stockGrid.limit, page.total);
+            document.getElementById('stock-page-info').innerText = page.total ? `${stockGrid.offset + 1}-${fin} / ${page.total}` : "0 produit";
 
             currentStock.forEach(p => {
                 const tr = document.createElement('tr');
@@ -417,12 +568,29 @@ html_content = """
                     </td>
                 `;
                 tbody.appendChild(tr);
+            });
+        }
 
+        // Sélecteur de la caisse : sa propre recherche, indépendante de la page affichée dans la grille
+        let rechercheCaisseTimer = null;
+
+        function rechercherCaisse() {
+            clearTimeout(rechercheCaisseTimer);
+            rechercheCaisseTimer = setTimeout(chargerSelecteurCaisse, 250);
+        }
+
+        async function chargerSelecteurCaisse() {
+            const produits = await pywebview.api.search_products(document.getElementById('sim-recherche').value);
+            const select = document.getElementById('sim-select');
+            const selection = select.value;
+            select.innerHTML = "<option value=''>-- Sélectionner Produit --</option>";
+            produits.forEach(p => {
                 const opt = document.createElement('option');
                 opt.value = p.id;
-                opt.innerText = `${p.nom} (${p.prix}€)`;
+                opt.innerText = `#${p.id} ${p.nom} (${p.prix}€)`;
                 select.appendChild(opt);
             });
+            if(produits.some(p => String(p.id) === selection)) select.value = selection;
         }
 
         async function ajouterProduit() {
@@ -432,12 +600,14 @@ html_content = """
                 document.getElementById('prod-qte').value
             );
             chargerInventaireJS();
+            chargerSelecteurCaisse();
         }
 
         async function suppr(id) {
             if(confirm('Supprimer ?')) {
                 await pywebview.api.delete_product(id);
                 chargerInventaireJS();
+                chargerSelecteurCaisse();
             }
         }
 
@@ -458,16 +628,18 @@ html_content = """
             );
             document.getElementById('edit-modal').classList.add('hidden');
             chargerInventaireJS();
+            chargerSelecteurCaisse();
         }
 
-        function ajouterAuPanier() {
+        async function ajouterAuPanier() {
             const pid = parseInt(document.getElementById('sim-select').value);
             const qte = parseInt(document.getElementById('sim-qte').value);
             
             if(!pid || qte <= 0) return alert("Sélection invalide");
 
-            const product = currentStock.find(p => p.id === pid);
-            if(!product) return;
+            // Données à jour du produit, quelle que soit la page affichée dans la grille
+            const product = await pywebview.api.get_product(pid);
+            if(!product) return alert("Produit introuvable");
 
             cart.push({
                 id: product.id,
@@ -629,15 +801,20 @@ class Api:
         valid, msg = valider_complexite_mdp(password)
         if not valid: return {"success": False, "message": msg}
         
-        is_pwned, count = verifier_leak_pwned(password)
+        try:
+            is_pwned, count = verifier_leak_pwned(password)
+        except pwned_store.LeakCheckUnavailable:
+            return {"success": False, "message": "Vérification des fuites indisponible (hors ligne). Réessayez plus tard."}
         if is_pwned:
             logging.warning(f"SECURITY: Refus MDP compromis ({count} fois) - User: {username}")
             return {"success": False, "message": f"DANGER : Ce mot de passe est apparu dans {count} fuites de données ! Choisissez-en un autre."}
         
         salt = secrets.token_hex(16)
         hashed = hacher_mdp(password, salt)
+        erreur = sauver_user(username, salt, hashed)
+        if erreur:
+            return {"success": False, "message": erreur}
         users_db[username] = {'salt': salt, 'hash': hashed}
-        sauver_user(username, salt, hashed)
         logging.info(f"SECURITY: Nouveau compte cree - User: {username}")
         return {"success": True}
 
@@ -648,13 +825,47 @@ class Api:
         return True
 
     def get_stock(self):
-        return sorted(list(data.values()), key=lambda x: x['id'])
+        return data.to_dicts()
+
+    def get_stock_page(self, offset=0, limit=50, tri='id', descendant=False, recherche=''):
+        # Seule la fenêtre visible part vers la webview
+        offset, limit = max(int(offset), 0), max(min(int(limit), 500), 1)
+        ordre = index_tri.get(tri, index_tri['id'])
+        ids = (pid for _, pid in (reversed(ordre) if descendant else ordre))
+
+        recherche = (recherche or '').strip().lower()
+        if recherche:
+            trouves = [pid for pid in ids if recherche in data[pid]['nom'].lower()]
+            total = len(trouves)
+            page = trouves[offset:offset + limit]
+        else:
+            total = len(ordre)
+            page = islice(ids, offset, offset + limit)
+
+        return {"total": total, "offset": offset, "items": [dict(data[pid]) for pid in page]}
+
+    def search_products(self, recherche='', limit=50):
+        # Sélecteur de la caisse : "#12" ou "12" cherche l'id, sinon le nom (tri alphabétique)
+        recherche = (recherche or '').strip()
+        produits = self.get_stock_page(0, limit, 'nom', False, recherche)['items']
+        pid = recherche.lstrip('#')
+        if pid.isdigit() and int(pid) in data:
+            produits = [dict(data[int(pid)])] + [p for p in produits if p['id'] != int(pid)][:max(int(limit), 1) - 1]
+        return produits
+
+    def get_product(self, pid):
+        pid = int(pid)
+        return dict(data[pid]) if pid in data else None
 
     def add_product(self, nom, prix, qte):
         global max_id
         try:
             max_id += 1
             data[max_id] = {"id": max_id, "nom": nom, "prix": float(prix), "quantite": int(qte)}
+            indexer_produit(data[max_id])
+            mouvements_en_attente.append(movements.movement(max_id, 0, int(qte), movements.CREATION))
+            modifies_en_attente.add(max_id)
+            supprimes_en_attente.discard(max_id)
             sauver_inventaire()
             logging.info(f"INVENTAIRE: Ajout produit #{max_id} {nom} (Qté: {qte})")
             return True
@@ -663,7 +874,10 @@ class Api:
     def delete_product(self, pid):
         if int(pid) in data:
             nom = data[int(pid)]['nom']
+            desindexer_produit(data[int(pid)])
+            mouvements_en_attente.append(movements.movement(int(pid), data[int(pid)]['quantite'], 0, movements.SUPPRESSION))
             del data[int(pid)]
+            supprimes_en_attente.add(int(pid))
             sauver_inventaire()
             logging.info(f"INVENTAIRE: Suppression produit #{pid} {nom}")
             return True
@@ -672,9 +886,7 @@ class Api:
     def update_product(self, pid, nom, prix, qte):
         pid = int(pid)
         if pid in data:
-            data[pid]['nom'] = nom
-            data[pid]['prix'] = float(prix)
-            data[pid]['quantite'] = int(qte)
+            modifier_produit(pid, nom=nom, prix=float(prix), quantite=int(qte))
             sauver_inventaire()
             logging.info(f"INVENTAIRE: Mise a jour produit #{pid} {nom}")
             return True
@@ -693,15 +905,15 @@ class Api:
         # 2. Génération d'un ID de transaction UNIQUE pour ce panier
         transaction_id = str(uuid.uuid4())[:8]
 
-        # 3. Traitement
-        for item in cart_items:
-            pid = int(item['id'])
-            qte_demandee = int(item['qte'])
-            
-            data[pid]['quantite'] -= qte_demandee
-            # On passe le transaction_id à l'enregistrement
-            enregistrer_vente(pid, data[pid]['nom'], data[pid]['prix'], qte_demandee, client_name, transaction_id)
-        
+        # 3. Enregistrement du panier complet en une seule écriture
+        lignes = [(int(item['id']), data[int(item['id'])]['nom'], data[int(item['id'])]['prix'], int(item['qte'])) for item in cart_items]
+        if not enregistrer_ventes(lignes, client_name, transaction_id):
+            return {"success": False, "message": "Erreur: enregistrement de la vente impossible."}
+
+        # 4. Déduction des stocks puis une seule sauvegarde de l'inventaire
+        for pid, _, _, qte_demandee in lignes:
+            modifier_produit(pid, movements.VENTE, transaction_id, quantite=data[pid]['quantite'] - qte_demandee)
+
         sauver_inventaire()
         return {"success": True, "message": "Commande validée avec succès !"}
 
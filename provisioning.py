@@ -0,0 +1,120 @@
+import argparse
+import csv
+import logging
+import os
+import secrets
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import database
+import passwords
+import pwned_store
+import tenants
+
+# Bulk account creation for onboarding a shop: same rules as the desktop Api.register
+# (complexity, known leaks, salted sha256), but checked concurrently, hashed across
+# cores for large batches, and written with a single append.
+
+# Leak checks are network-bound when there is no local pwned.bin (online range API)
+LEAK_CHECK_WORKERS = 16
+# Below this many accounts, starting worker processes costs more than hashing inline
+PARALLEL_HASH_MIN_USERS = 50_000
+
+
+def _leak_check(password: str) -> Optional[Tuple[bool, int]]:
+    # None when the password could not be checked: the account is not created
+    try:
+        return pwned_store.check_password(password)
+    except pwned_store.LeakCheckUnavailable:
+        return None
+
+def _hash_chunk(plain: List[str], salts: List[str]) -> List[str]:
+    return [passwords.hash_password(p, s) for p, s in zip(plain, salts)]
+
+def _hash_all(plain: List[str], salts: List[str], workers: Optional[int]) -> List[str]:
+    workers = workers or os.cpu_count() or 1
+    if len(plain) < PARALLEL_HASH_MIN_USERS or workers == 1:
+        return _hash_chunk(plain, salts)
+    # One task per worker: a single sha256 is far cheaper than shipping it to a process
+    size = -(-len(plain) // workers)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        starts = range(0, len(plain), size)
+        chunks = pool.map(_hash_chunk, [plain[i:i + size] for i in starts], [salts[i:i + size] for i in starts])
+        return [h for chunk in chunks for h in chunk]
+
+def provision_users(users: List[Tuple[str, str]], workers: Optional[int] = None) -> List[Dict]:
+    # Returns one {"username", "created", "message"} per input, in input order
+    report = [{"username": username, "created": False, "message": ""} for username, _ in users]
+
+    # 1. Cheap checks first: names, existing accounts, complexity
+    candidates = []
+    for i, (username, password) in enumerate(users):
+        if not username:
+            report[i]["message"] = "Empty username"
+        elif database.get_user_credentials(username) is not None:
+            report[i]["message"] = "Already exists"
+        else:
+            valid, message = passwords.validate(password, "en")
+            if valid:
+                candidates.append(i)
+            else:
+                report[i]["message"] = message
+
+    # 2. Known leaks, checked concurrently
+    with ThreadPoolExecutor(max_workers=LEAK_CHECK_WORKERS) as pool:
+        leaks = list(pool.map(lambda i: _leak_check(users[i][1]), candidates))
+    # A name repeated in the batch goes to its first row that passed every check
+    accepted = []
+    seen = set()
+    for i, leak in zip(candidates, leaks):
+        if leak is None:
+            report[i]["message"] = "Leak check unavailable, retry later"
+            continue
+        is_pwned, count = leak
+        if is_pwned:
+            logging.warning(f"SECURITY: Refus MDP compromis ({count} fois) - User: {users[i][0]}")
+            report[i]["message"] = f"Password found in {count} data breaches"
+        elif users[i][0] in seen:
+            report[i]["message"] = "Already exists"
+        else:
+            seen.add(users[i][0])
+            accepted.append(i)
+
+    # 3. Hash, then one append for every accepted account
+    salts = [secrets.token_hex(16) for _ in accepted]
+    hashes = _hash_all([users[i][1] for i in accepted], salts, workers)
+    rows = [{"username": users[i][0], "salt": salt, "hash": hashed} for i, salt, hashed in zip(accepted, salts, hashes)]
+    saved = database.add_users(rows) if rows else []
+    if saved is None:
+        for i in accepted:
+            report[i]["message"] = "Could not save user"
+        return report
+
+    created = set(saved)
+
+    for i in accepted:
+        if users[i][0] not in created:
+            # Created by a concurrent call since the check above
+            report[i]["message"] = "Already exists"
+            continue
+        report[i]["created"] = True
+        report[i]["message"] = "Created"
+        logging.info(f"SECURITY: Nouveau compte cree - User: {users[i][0]}")
+    logging.info(f"SECURITY: Provisionnement - {len(created)}/{len(users)} compte(s) cree(s)")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Creation de comptes en masse")
+    parser.add_argument("source", help="CSV username;password")
+    parser.add_argument("--tenant", default=tenants.DEFAULT_TENANT)
+    parser.add_argument("--workers", type=int, default=None, help="Processus de hachage (defaut: nb de coeurs)")
+    args = parser.parse_args()
+
+    with open(args.source, newline="", encoding="utf-8") as f:
+        entries = [(row["username"], row["password"]) for row in csv.DictReader(f, delimiter=";")]
+    with tenants.use_tenant(args.tenant):
+        results = provision_users(entries, args.workers)
+    for r in results:
+        print(f"{'OK ' if r['created'] else 'KO '} {r['username']}: {r['message']}")
+    print(f"{sum(r['created'] for r in results)}/{len(results)} compte(s) cree(s)")
@@ -0,0 +1,204 @@
+import argparse
+import hashlib
+import logging
+import mmap
+import os
+import struct
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple
+
+import requests
+
+# Local copy of the "Have I Been Pwned" password hashes.
+#
+# Binary layout (little-endian):
+#   header  : MAGIC (8 bytes) + record count (uint64)
+#   fanout  : 65537 x uint64, index of the first record for each 2-byte hash prefix
+#   records : sorted (sha1 digest 20 bytes, count uint32)
+
+PWNED_STORE_PATH = os.environ.get("PWNED_STORE", "pwned.bin")
+RANGE_API_URL = "https://api.pwnedpasswords.com/range/{}"
+USER_AGENT = 'SaaS-Stock-Manager-Pro/1.0'
+
+MAGIC = b"PWNDSTO1"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<20sI")
+FANOUT_SIZE = 65537
+
+
+class LeakCheckUnavailable(Exception):
+    # No local store and the range API unreachable: the password could not be checked
+    pass
+
+
+class PwnedStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.size = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a pwned password store")
+        self._fanout = array("Q")
+        self._fanout.frombytes(self._mm[HEADER.size:HEADER.size + 8 * FANOUT_SIZE])
+        if array("Q", [1]).tobytes() != (1).to_bytes(8, "little"):
+            self._fanout.byteswap()
+        self._records_offset = HEADER.size + 8 * FANOUT_SIZE
+
+    def count(self, sha1_hex: str) -> int:
+        digest = bytes.fromhex(sha1_hex)
+        bucket = int.from_bytes(digest[:2], "big")
+        lo, hi = self._fanout[bucket], self._fanout[bucket + 1]
+        mm, base, width = self._mm, self._records_offset, RECORD.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            offset = base + mid * width
+            key = mm[offset:offset + 20]
+            if key < digest:
+                lo = mid + 1
+            elif key > digest:
+                hi = mid
+            else:
+                return RECORD.unpack_from(mm, offset)[1]
+        return 0
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+# --- LOADING ---
+
+_store: Optional[PwnedStore] = None
+_store_loaded = False
+
+def get_store() -> Optional[PwnedStore]:
+    global _store, _store_loaded
+    if not _store_loaded:
+        _store_loaded = True
+        if os.path.exists(PWNED_STORE_PATH):
+            try:
+                _store = PwnedStore(PWNED_STORE_PATH)
+            except (OSError, ValueError) as e:
+                logging.error(f"SYSTEM: Erreur chargement base MDP compromis - {e}")
+    return _store
+
+def set_store_path(path: str):
+    # Used by tests (fixture dump) and by the CLI after a rebuild
+    global PWNED_STORE_PATH, _store, _store_loaded
+    if _store is not None:
+        _store.close()
+    PWNED_STORE_PATH = path
+    _store, _store_loaded = None, False
+
+
+# --- ONLINE FALLBACK (no local store) ---
+
+@lru_cache(maxsize=4096)
+def fetch_range(prefix: str) -> Dict[str, int]:
+    # Failures raise and are therefore never cached
+    response = requests.get(RANGE_API_URL.format(prefix), headers={'User-Agent': USER_AGENT}, timeout=3)
+    response.raise_for_status()
+    result = {}
+    for line in response.text.splitlines():
+        suffix, _, count = line.partition(":")
+        result[suffix] = int(count)
+    return result
+
+def check_password(password: str) -> Tuple[bool, int]:
+    # (found, count); raises LeakCheckUnavailable rather than passing an unchecked password
+    sha1_password = hashlib.sha1(password.encode('utf-8')).hexdigest().upper()
+    store = get_store()
+    if store is not None:
+        count = store.count(sha1_password)
+        return count > 0, count
+
+    prefix, suffix = sha1_password[:5], sha1_password[5:]
+    try:
+        count = fetch_range(prefix).get(suffix, 0)
+    except Exception as e:
+        logging.warning(f"SECURITY: Verification fuite indisponible (ni base locale ni API) - {e}")
+        raise LeakCheckUnavailable(str(e)) from e
+    return count > 0, count
+
+
+# --- BUILD / DOWNLOAD ---
+
+def _iter_source(source: str) -> Iterator[Tuple[str, int]]:
+    # Either one "HASH:COUNT" file (official downloader output) or a directory of <PREFIX>.txt range files
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            prefix = name.split(".")[0].upper()
+            with open(os.path.join(source, name), "r", encoding="utf-8") as f:
+                for line in f:
+                    suffix, _, count = line.strip().partition(":")
+                    if suffix:
+                        yield prefix + suffix.upper(), int(count)
+    else:
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                full_hash, _, count = line.strip().partition(":")
+                if full_hash:
+                    yield full_hash.upper(), int(count)
+
+def build_store(source: str, dest: str) -> int:
+    fanout = array("Q", [0] * FANOUT_SIZE)
+    tmp = dest + ".tmp"
+    n = 0
+    previous = b""
+    with open(tmp, "wb") as out:
+        out.write(HEADER.pack(MAGIC, 0))
+        out.write(bytes(8 * FANOUT_SIZE))
+        for full_hash, count in _iter_source(source):
+            digest = bytes.fromhex(full_hash)
+            if digest <= previous:
+                raise ValueError(f"{source}: hashes must be sorted and unique ({full_hash})")
+            previous = digest
+            out.write(RECORD.pack(digest, min(count, 0xFFFFFFFF)))
+            fanout[int.from_bytes(digest[:2], "big") + 1] += 1
+            n += 1
+        for i in range(1, FANOUT_SIZE):
+            fanout[i] += fanout[i - 1]
+        out.seek(0)
+        out.write(HEADER.pack(MAGIC, n))
+        out.write(struct.pack(f"<{FANOUT_SIZE}Q", *fanout))
+    os.replace(tmp, dest)
+    return n
+
+def download_ranges(dest_dir: str, workers: int = 16):
+    os.makedirs(dest_dir, exist_ok=True)
+
+    def fetch(i: int):
+        prefix = f"{i:05X}"
+        path = os.path.join(dest_dir, prefix + ".txt")
+        if os.path.exists(path):
+            return
+        response = requests.get(RANGE_API_URL.format(prefix), headers={'User-Agent': USER_AGENT}, timeout=30)
+        response.raise_for_status()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(response.text)
+        os.replace(path + ".tmp", path)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for _ in pool.map(fetch, range(16 ** 5)):
+            pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Base locale des mots de passe compromis")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_download = sub.add_parser("download", help="Telecharger toutes les plages k-anonymity")
+    p_download.add_argument("dest_dir")
+    p_download.add_argument("--workers", type=int, default=16)
+    p_build = sub.add_parser("build", help="Construire le fichier binaire")
+    p_build.add_argument("source", help="Fichier HASH:COUNT ou dossier de plages")
+    p_build.add_argument("dest", nargs="?", default=PWNED_STORE_PATH)
+    args = parser.parse_args()
+
+    if args.command == "download":
+        download_ranges(args.dest_dir, args.workers)
+    else:
+        print(f"{build_store(args.source, args.dest)} hashes -> {args.dest}")
@@ -0,0 +1,23 @@
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+
+def render_json(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    # Returned directly by list endpoints whose rows are already typed by database.py:
+    # FastAPI skips response_model validation/serialization for Response objects,
+    # while the declared response_model still documents the schema in OpenAPI.
+    def render(self, content: Any) -> bytes:
+        return render_json(content)
@@ -0,0 +1,145 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: jobs still run, but once per worker
+    fcntl = None
+
+SCHEDULER_LOCK_DIR = os.environ.get("SCHEDULER_LOCK_DIR", ".")
+
+
+class Job:
+    def __init__(self, name: str, interval: float, func: Callable[[], None], run_on_start: bool = False,
+                 per_worker: bool = False):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.run_on_start = run_on_start
+        # Jobs filling per-process memory (cache warming) run in every worker, without the lock
+        self.per_worker = per_worker
+        # Metrics
+        self.runs = 0
+        self.failures = 0
+        self.skipped = 0
+        self.last_duration: Optional[float] = None
+        self.total_duration = 0.0
+        self.last_run: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    def metrics(self) -> Dict:
+        return {
+            "name": self.name,
+            "interval": self.interval,
+            "per_worker": self.per_worker,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "last_duration_ms": round(self.last_duration * 1000, 3) if self.last_duration is not None else None,
+            "avg_duration_ms": round(self.total_duration / self.runs * 1000, 3) if self.runs else None,
+            "last_run": self.last_run,
+            "last_error": self.last_error,
+        }
+
+
+class Scheduler:
+    # Interval jobs run in a worker thread, off the event loop. Across uvicorn workers,
+    # a per-job lock file holding the last run time lets only one worker run each tick
+    # (jobs maintaining shared files); per_worker jobs run in every worker.
+
+    def __init__(self, lock_dir: str = SCHEDULER_LOCK_DIR):
+        self.lock_dir = lock_dir
+        self._jobs: Dict[str, Job] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def add_job(self, name: str, interval: float, func: Callable[[], None], run_on_start: bool = False,
+                per_worker: bool = False) -> Job:
+        job = Job(name, interval, func, run_on_start, per_worker)
+        self._jobs[name] = job
+        return job
+
+    def every(self, interval: float, name: Optional[str] = None, run_on_start: bool = False, per_worker: bool = False):
+        def decorator(func):
+            self.add_job(name or func.__name__, interval, func, run_on_start, per_worker)
+            return func
+        return decorator
+
+    async def start(self):
+        for job in self._jobs.values():
+            self._tasks.append(asyncio.create_task(self._loop(job), name=f"job:{job.name}"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def metrics(self) -> List[Dict]:
+        return [job.metrics() for job in self._jobs.values()]
+
+    async def _loop(self, job: Job):
+        if not job.run_on_start:
+            await asyncio.sleep(job.interval)
+        while True:
+            await self.run_job(job)
+            await asyncio.sleep(job.interval)
+
+    async def run_job(self, job: Job):
+        # The lock is taken and released by the thread running the job: cancelling this
+        # coroutine on shutdown cannot free it while the job is still running
+        await asyncio.to_thread(self._run, job)
+
+    def _run(self, job: Job):
+        lock_file = None if job.per_worker else self._acquire(job)
+        if lock_file is False:
+            job.skipped += 1
+            return
+        start = time.perf_counter()
+        try:
+            job.func()
+            job.last_error = None
+        except Exception as e:
+            job.failures += 1
+            job.last_error = repr(e)
+            logging.error(f"SYSTEM: Job {job.name} failed - {e}")
+        finally:
+            job.last_duration = time.perf_counter() - start
+            job.total_duration += job.last_duration
+            job.runs += 1
+            job.last_run = time.time()
+            self._release(lock_file, job.last_run)
+
+    def _acquire(self, job: Job):
+        # Returns the locked file, None when locking is unavailable, False when another worker owns this tick
+        if fcntl is None:
+            return None
+        f = open(os.path.join(self.lock_dir, f".scheduler-{job.name}.lock"), "a+")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        f.seek(0)
+        try:
+            last_run = float(f.read() or 0)
+        except ValueError:
+            last_run = 0.0
+        # Another worker already ran it during this interval
+        if time.time() - last_run < job.interval * 0.9:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            f.close()
+            return False
+        return f
+
+    def _release(self, f, last_run: float):
+        if not f:
+            return
+        f.seek(0)
+        f.truncate()
+        f.write(str(last_run))
+        f.flush()
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        f.close()
@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+DEFAULT_MAX_ENTRIES = 256
+
+
+class _Call:
+    __slots__ = ("done", "result", "error", "expires")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.expires = 0.0
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one execution of `func` and its result
+    # (or exception). With ttl > 0 the result is also kept for ttl seconds, so a burst
+    # of callers arriving just after it finished costs nothing either. Keys must carry
+    # everything the result depends on (tenant, data version, ...): results are shared
+    # between users.
+
+    def __init__(self, ttl: float = 0.0, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        # Metrics
+        self.executions = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, func: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None and (not call.done.is_set() or call.expires > now):
+                self.shared += 1
+                owner = False
+            else:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+                owner = True
+                self._prune(now)
+
+        if not owner:
+            call.done.wait()
+        else:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    # Failures are never cached; without ttl nothing is
+                    call.expires = time.monotonic() + self.ttl if call.error is None else 0.0
+                    if (call.error is not None or self.ttl <= 0) and self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def _prune(self, now: float):
+        # Expired results go first (they may be large), then the oldest finished ones
+        for key in [k for k, c in self._calls.items() if c.done.is_set() and c.expires <= now]:
+            del self._calls[key]
+        excess = len(self._calls) - self.max_entries
+        for key in [k for k, c in self._calls.items() if c.done.is_set()][:max(excess, 0)]:
+            del self._calls[key]
@@ -0,0 +1,100 @@
+import csv
+import mmap
+import os
+import struct
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+# Binary inventory snapshot, written next to the CSV after every save.
+# The CSV stays the interchange/export format; the snapshot only speeds up loading.
+#
+# Layout (little-endian):
+#   header  : MAGIC, record count, CSV size, CSV mtime (ns)
+#   records : fixed width (id, prix, quantite, name offset, name length), sorted by id
+#   strings : UTF-8 names, concatenated
+#
+# The header pins the CSV it was built from (size + mtime): if the CSV was changed
+# by anything else (desktop app, manual edit), the snapshot is ignored.
+
+MAGIC = b"INVSNAP1"
+HEADER = struct.Struct("<8sQQq")
+RECORD = struct.Struct("<qdqII")
+
+
+def snapshot_path(csv_path: str) -> str:
+    return os.path.splitext(csv_path)[0] + ".snap"
+
+def csv_signature(csv_path: str) -> Tuple[int, int]:
+    st = os.stat(csv_path)
+    return st.st_size, st.st_mtime_ns
+
+def write_snapshot(products: List[Dict], csv_path: str, signature: Optional[Tuple[int, int]] = None):
+    # Readers pass the signature taken *before* parsing the CSV: if it changed meanwhile,
+    # the snapshot is born stale and will simply be ignored.
+    path = snapshot_path(csv_path)
+    size, mtime_ns = signature or csv_signature(csv_path)
+    names = bytearray()
+    records = bytearray(RECORD.size * len(products))
+    for i, p in enumerate(sorted(products, key=lambda x: x['id'])):
+        encoded = p['nom'].encode('utf-8')
+        RECORD.pack_into(records, i * RECORD.size, p['id'], p['prix'], p['quantite'], len(names), len(encoded))
+        names += encoded
+    # Unique temp name: several workers may rebuild the same stale snapshot at once
+    tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(products), size, mtime_ns))
+            f.write(records)
+            f.write(names)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def load_snapshot(csv_path: str) -> Optional[List[Dict]]:
+    # None when there is no snapshot or it does not match the current CSV
+    path = snapshot_path(csv_path)
+    try:
+        signature = csv_signature(csv_path)
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                magic, count, size, mtime_ns = HEADER.unpack_from(mm, 0)
+                if magic != MAGIC or (size, mtime_ns) != signature:
+                    return None
+                records_end = HEADER.size + count * RECORD.size
+                strings = mm[records_end:]
+                view = memoryview(mm)[HEADER.size:records_end]
+                try:
+                    return [
+                        {"id": pid, "nom": strings[off:off + length].decode('utf-8'), "prix": prix, "quantite": quantite}
+                        for pid, prix, quantite, off, length in RECORD.iter_unpack(view)
+                    ]
+                finally:
+                    view.release()
+    except (OSError, ValueError, struct.error):
+        return None
+
+def read_csv(csv_path: str) -> List[Dict]:
+    with open(csv_path, "r", newline="", encoding='utf-8') as f:
+        return sorted(
+            ({"id": int(r["id"]), "nom": r["nom"], "prix": float(r["prix"]), "quantite": int(r["quantite"])}
+             for r in csv.DictReader(f, delimiter=";")),
+            key=lambda x: x['id'],
+        )
+
+def verify_snapshot(csv_path: str) -> bool:
+    # Full consistency check: the snapshot decodes to exactly the CSV content
+    products = load_snapshot(csv_path)
+    return products is not None and products == read_csv(csv_path)
+
+
+if __name__ == "__main__":
+    import sys
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    csv_file = args[0] if args else 'inventaire.csv'
+    if "--rebuild" in sys.argv:
+        write_snapshot(read_csv(csv_file), csv_file)
+    print("OK" if verify_snapshot(csv_file) else "ABSENT OU INCOHERENT")
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+
+import analytics
+import catalog
+import changes
+import indexes
+import versions
+
+# One process serves many shops: each tenant has its own directory of CSV files
+# and its own in-memory caches. The default tenant keeps the historical files in
+# the working directory.
+
+DEFAULT_TENANT = "default"
+TENANTS_DIR = os.environ.get("TENANTS_DIR", "tenants")
+
+# Idle tenants beyond this count are forgotten, caches and version mapping included (LRU)
+MAX_CACHED_TENANTS = int(os.environ.get("MAX_CACHED_TENANTS", "200"))
+# Cached rows (products, catalog changes, sales aggregates, clients, users): per tenant, and for the whole process
+TENANT_CACHE_ROWS = int(os.environ.get("TENANT_CACHE_ROWS", "500000"))
+TOTAL_CACHE_ROWS = int(os.environ.get("TOTAL_CACHE_ROWS", "2000000"))
+# A tenant above TENANT_CACHE_ROWS is served by plain file scans for this long before caching is tried again
+UNCACHED_SECONDS = float(os.environ.get("TENANT_UNCACHED_SECONDS", "300"))
+
+_TENANT_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,63}$")
+
+_current_tenant: ContextVar[str] = ContextVar("tenant", default=DEFAULT_TENANT)
+
+def validate_tenant_id(tenant_id: str) -> str:
+    if tenant_id != DEFAULT_TENANT and not _TENANT_RE.match(tenant_id or ""):
+        raise ValueError(f"Invalid tenant id: {tenant_id!r}")
+    return tenant_id
+
+def tenant_dir(tenant_id: str) -> str:
+    return "." if tenant_id == DEFAULT_TENANT else os.path.join(TENANTS_DIR, tenant_id)
+
+def tenant_exists(tenant_id: str) -> bool:
+    return tenant_id == DEFAULT_TENANT or os.path.isdir(tenant_dir(tenant_id))
+
+def tenant_ids() -> List[str]:
+    # Every tenant on disk, for maintenance jobs that are not limited to the tenants a worker has seen
+    try:
+        names = sorted(os.listdir(TENANTS_DIR))
+    except OSError:
+        names = []
+    return [DEFAULT_TENANT] + [name for name in names if _TENANT_RE.match(name) and os.path.isdir(tenant_dir(name))]
+
+def create_tenant(tenant_id: str):
+    os.makedirs(tenant_dir(validate_tenant_id(tenant_id)), exist_ok=True)
+
+def current_tenant() -> str:
+    return _current_tenant.get()
+
+def set_current_tenant(tenant_id: str):
+    return _current_tenant.set(validate_tenant_id(tenant_id))
+
+@contextmanager
+def use_tenant(tenant_id: str):
+    token = set_current_tenant(tenant_id)
+    try:
+        yield
+    finally:
+        _current_tenant.reset(token)
+
+
+class TenantState:
+    def __init__(self, tenant_id: str, files: Dict[str, str]):
+        self.tenant_id = tenant_id
+        base = tenant_dir(tenant_id)
+        self.inventory_file = os.path.join(base, files["inventory"])
+        self.users_file = os.path.join(base, files["users"])
+        self.ledger_file = os.path.join(base, files["ledger"])
+        # Shared with the other workers serving this tenant (see versions.py)
+        self.versions = versions.SharedVersions(os.path.join(base, versions.VERSIONS_FILE))
+        self.lock = threading.RLock()
+        # Until then, reads scan the files instead of building caches (see enforce_budget)
+        self.uncached_until = 0.0
+        self.drop_caches()
+
+    def drop_caches(self):
+        self.catalog = catalog.CompactCatalog()
+        self.search_index = indexes.ProductSearchIndex()
+        self.stock_index = indexes.StockLevelIndex()
+        self.indexes_version = -1
+        self.journal = changes.ChangeJournal()
+        # The rollup and the client index are both derived from the ledger and share its version
+        self.rollup = analytics.SalesRollup()
+        self.clients = analytics.ClientIndex()
+        self.rollup_version = -1
+        # Ledger bytes already folded into the rollup and the client index
+        self.ledger_offset = 0
+        self.users: Dict[str, Dict[str, str]] = {}
+        self.users_version = -1
+
+    @property
+    def cached(self) -> bool:
+        return time.monotonic() >= self.uncached_until
+
+    def bump(self, dataset: str) -> int:
+        return self.versions.bump(dataset)
+
+    def cache_rows(self) -> int:
+        return len(self.catalog) + self.journal.entries + self.rollup.entries + self.clients.entries + len(self.users)
+
+
+class TenantRegistry:
+    def __init__(self, files: Dict[str, str]):
+        self._files = files
+        self._states: "OrderedDict[str, TenantState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, tenant_id: str) -> TenantState:
+        with self._lock:
+            state = self._states.get(tenant_id)
+            if state is None:
+                state = self._states[tenant_id] = TenantState(tenant_id, self._files)
+            self._states.move_to_end(tenant_id)
+            return state
+
+    def enforce_budget(self, active: TenantState):
+        # 1. A tenant above its own cap is served from files rather than crowding the others out,
+        # without rebuilding caches on every request
+        if active.cache_rows() > TENANT_CACHE_ROWS:
+            with active.lock:
+                active.drop_caches()
+                active.uncached_until = time.monotonic() + UNCACHED_SECONDS
+
+        # 2. Least recently used tenants are forgotten, then give their caches back first.
+        # A request still using a forgotten state finishes with it; its mmap closes with the last reference.
+        with self._lock:
+            while len(self._states) > MAX_CACHED_TENANTS:
+                tenant_id, state = next(iter(self._states.items()))
+                if state is active:
+                    break
+                del self._states[tenant_id]
+            cached = [s for s in self._states.values() if s is not active and s.cache_rows() > 0]
+        total = active.cache_rows() + sum(s.cache_rows() for s in cached)
+        for state in cached:
+            if total <= TOTAL_CACHE_ROWS:
+                break
+            total -= state.cache_rows()
+            with state.lock:
+                state.drop_caches()
+
+    def states(self) -> List[TenantState]:
+        with self._lock:
+            return list(self._states.values())
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3 or sys.argv[1] != "create":
+        sys.exit("usage: python tenants.py create <tenant_id>")
+    create_tenant(sys.argv[2])
+    print(f"Tenant {sys.argv[2]} -> {tenant_dir(sys.argv[2])}")
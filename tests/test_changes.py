@@ -0,0 +1,27 @@
+import changes
+
+
+def journal(csv_path):
+    index = changes.ChangeJournal()
+    index.refresh(changes.journal_path(csv_path))
+    return index
+
+
+def test_compact_keeps_latest_change_of_live_products(tmp_path, monkeypatch):
+    monkeypatch.setattr(changes, "COMPACT_MIN_CHANGES", 10)
+    csv_path = str(tmp_path / "inventaire.csv")
+    for _ in range(10):
+        changes.append(csv_path, changed=[1, 2, 3])
+    changes.append(csv_path, deleted=[2])
+    before = journal(csv_path)
+
+    assert changes.compact(csv_path)
+    after = journal(csv_path)
+    assert after.epoch != before.epoch
+    assert after.entries == 2
+    assert [pid for pid, _, _ in after.since(0)] == [1, 3]
+
+    # Appends go to the new file, and a small journal is left alone
+    changes.append(csv_path, changed=[4])
+    assert [pid for pid, _, _ in journal(csv_path).since(after.version)] == [4]
+    assert not changes.compact(csv_path)
@@ -0,0 +1,75 @@
+import csv
+import random
+
+import pytest
+
+import analytics
+import parallel_stats
+
+FIELDNAMES = ['date', 'tid', 'id_prod', 'nom', 'prix', 'qte', 'total', 'client']
+
+
+def write_ledger(path, rows):
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDNAMES, delimiter=";")
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def sequential(path):
+    # What _ensure_rollup does on a full rebuild
+    with open(path, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f, delimiter=";"))
+    rollup, clients = analytics.SalesRollup(), analytics.ClientIndex()
+    rollup.rebuild(rows)
+    clients.rebuild(rows)
+    return rollup, clients
+
+
+def summary(rollup, clients):
+    # What the API serves
+    return (round(rollup.ca_total, 2), rollup.volume_total,
+            {d: round(v, 2) for d, v in rollup.revenue_by_day.items()},
+            rollup.top_k(20), [(nom, round(v, 2)) for nom, v in rollup.top_k(20, "revenue")],
+            sorted(clients.top(), key=lambda c: c["client"]), clients.orders("Client 1"))
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    # Orders of 1 to 3 lines, with sub-cent prices
+    rng = random.Random(0)
+    rows = []
+    for i in range(300):
+        tid, client, date = f"{i:08x}", f"Client {rng.randint(1, 12)}", f"2026-01-{1 + i % 28:02d}"
+        for _ in range(rng.randint(1, 3)):
+            pid = rng.randint(1, 30)
+            prix = rng.choice([0.125, 0.005, 19.99, round(rng.uniform(1, 900), 3)])
+            qte = rng.randint(1, 5)
+            rows.append({"date": date, "tid": tid, "id_prod": pid, "nom": f"Produit {pid}", "prix": prix,
+                         "qte": qte, "total": prix * qte, "client": client})
+    path = tmp_path / "ventes.csv"
+    write_ledger(path, rows)
+    return str(path)
+
+
+def test_sub_cent_totals_are_not_rounded(tmp_path):
+    path = tmp_path / "ventes.csv"
+    write_ledger(path, [{"date": "2026-01-01", "tid": f"{i:08x}", "id_prod": 1, "nom": "Vis", "prix": 0.125,
+                         "qte": 1, "total": 0.125, "client": "Client 1"} for i in range(8)])
+    for workers in (1, 4):
+        rollup, clients, _ = parallel_stats.rebuild(str(path), workers)
+        assert rollup.ca_total == 1.0
+        assert clients.top()[0]["ca_total"] == 1.0
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3])
+def test_rebuild_matches_sequential_scan(ledger, workers):
+    rollup, clients, offset = parallel_stats.rebuild(ledger, workers)
+    expected_rollup, expected_clients = sequential(ledger)
+    assert summary(rollup, clients) == summary(expected_rollup, expected_clients)
+    # Same float additions in the same order: equal before any rounding
+    assert rollup.ca_total == expected_rollup.ca_total
+    assert rollup.revenue_by_day == expected_rollup.revenue_by_day
+    assert clients._clients == expected_clients._clients
+    with open(ledger, "rb") as f:
+        assert offset == len(f.read())
@@ -0,0 +1,59 @@
+import hashlib
+
+import pytest
+
+import pwned_store
+
+LEAKS = {"password": 9545824, "Azerty123": 2311, "Motdepasse1": 57}
+
+
+def sha1(password):
+    return hashlib.sha1(password.encode("utf-8")).hexdigest().upper()
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Store built from a "HASH:COUNT" dump, as the CLI does from the official one
+    source = tmp_path / "pwned.txt"
+    source.write_text("".join(f"{h}:{c}\n" for h, c in sorted((sha1(p), c) for p, c in LEAKS.items())))
+    original = pwned_store.PWNED_STORE_PATH
+    assert pwned_store.build_store(str(source), str(tmp_path / "pwned.bin")) == len(LEAKS)
+    pwned_store.set_store_path(str(tmp_path / "pwned.bin"))
+    yield
+    pwned_store.set_store_path(original)
+
+
+def test_known_password_is_found(store):
+    assert pwned_store.check_password("password") == (True, 9545824)
+    assert pwned_store.check_password("Motdepasse1") == (True, 57)
+
+
+def test_unknown_password_is_not_found(store):
+    assert pwned_store.check_password("Un-Mot-De-Passe-Inconnu-42") == (False, 0)
+    # Hashes are exact: case matters
+    assert pwned_store.check_password("Password") == (False, 0)
+
+
+def test_build_requires_sorted_hashes(tmp_path):
+    source = tmp_path / "pwned.txt"
+    source.write_text("".join(f"{h}:1\n" for h in sorted((sha1(p) for p in LEAKS), reverse=True)))
+    with pytest.raises(ValueError):
+        pwned_store.build_store(str(source), str(tmp_path / "pwned.bin"))
+
+
+def test_no_store_checks_online(store, tmp_path, monkeypatch):
+    ranges = {sha1("Azerty123")[:5]: {sha1("Azerty123")[5:]: 2311}}
+    monkeypatch.setattr(pwned_store, "fetch_range", lambda prefix: ranges.get(prefix, {}))
+    pwned_store.set_store_path(str(tmp_path / "absent.bin"))
+    assert pwned_store.check_password("Azerty123") == (True, 2311)
+    assert pwned_store.check_password("Un-Mot-De-Passe-Inconnu-42") == (False, 0)
+
+
+def test_no_store_and_offline_fails_closed(store, tmp_path, monkeypatch):
+    def offline(prefix):
+        raise OSError("network unreachable")
+
+    monkeypatch.setattr(pwned_store, "fetch_range", offline)
+    pwned_store.set_store_path(str(tmp_path / "absent.bin"))
+    with pytest.raises(pwned_store.LeakCheckUnavailable):
+        pwned_store.check_password("password")
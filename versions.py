@@ -0,0 +1,80 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: counters are still shared through the mapping, bumps are only serialized per process
+    fcntl = None
+
+# One monotonic counter per dataset, in a small memory-mapped file next to the tenant's
+# CSV files. Every worker (and the desktop app) maps the same file: writers bump a
+# counter under an flock, readers load 8 bytes from shared memory, so in-memory caches
+# notice another process's writes without stat-ing the data files.
+
+DATASETS = ("inventory", "ledger", "users")
+VERSIONS_FILE = ".versions"
+
+_SLOT = struct.Struct("<q")
+_SIZE = _SLOT.size * len(DATASETS)
+_OFFSETS = {dataset: i * _SLOT.size for i, dataset in enumerate(DATASETS)}
+
+
+class SharedVersions:
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+        try:
+            self._file = open(path, "a+b")
+            with self._exclusive():
+                if os.fstat(self._file.fileno()).st_size < _SIZE:
+                    self._file.truncate(0)
+                    self._file.write(self._initial())
+                    self._file.flush()
+            self._mm = mmap.mmap(self._file.fileno(), _SIZE)
+        except (OSError, TypeError, ValueError):
+            # No usable file (missing tenant directory, read-only disk): private counters
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self._mm = mmap.mmap(-1, _SIZE)
+            self._mm[:] = self._initial()
+
+    @staticmethod
+    def _initial() -> bytes:
+        # Counters start at the creation time (ns): a recreated file never repeats a version
+        start = time.time_ns()
+        return _SLOT.pack(start) * len(DATASETS)
+
+    @contextmanager
+    def _exclusive(self):
+        if self._file is None or fcntl is None:
+            yield
+            return
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+    def __getitem__(self, dataset: str) -> int:
+        return _SLOT.unpack_from(self._mm, _OFFSETS[dataset])[0]
+
+    def bump(self, dataset: str) -> int:
+        offset = _OFFSETS[dataset]
+        with self._lock, self._exclusive():
+            version = _SLOT.unpack_from(self._mm, offset)[0] + 1
+            _SLOT.pack_into(self._mm, offset, version)
+        return version
+
+    def close(self):
+        self._mm.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None